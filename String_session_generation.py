@@ -7,3 +7,4 @@ api_hash = input("Enter your API HASH: ")
 with TelegramClient(StringSession(), api_id, api_hash) as client:
     print("Session string:")
     print(client.session.save())
+    print("Use it as STRING_SESSION, or add it to STRING_SESSIONS (comma-separated) for extra sending accounts.")
@@ -0,0 +1,66 @@
+"""
+Album aggregation.
+
+Telegram delivers an album as separate messages sharing a grouped_id, all
+within a fraction of a second. The collector holds the parts of each group
+until no new part has arrived for `window` seconds (or the 10-part album
+limit is reached) and then hands the whole album, ordered by message ID, to
+`on_album(parts, source, *args)` so it can be sent with a single send_file.
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Telegram doesn't allow more than 10 items per album
+MAX_ALBUM_PARTS = 10
+
+
+class _Group:
+    __slots__ = ("parts", "timer", "args")
+
+    def __init__(self, args):
+        self.parts = {}
+        self.timer = None
+        self.args = args
+
+
+class AlbumCollector:
+    def __init__(self, window, on_album):
+        self.window = window
+        self.on_album = on_album
+        self.groups = {}
+
+    def add(self, source, message, *args):
+        """Buffer one album part; extra args are passed on to on_album."""
+        key = (source, message.grouped_id)
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = _Group(args)
+        group.parts[message.id] = message
+        if group.timer is not None:
+            group.timer.cancel()
+        if len(group.parts) >= MAX_ALBUM_PARTS:
+            self._flush(key)
+        else:
+            group.timer = asyncio.get_running_loop().call_later(self.window, self._flush, key)
+
+    def _flush(self, key):
+        group = self.groups.pop(key, None)
+        if group is None:
+            return
+        if group.timer is not None:
+            group.timer.cancel()
+        parts = [group.parts[msg_id] for msg_id in sorted(group.parts)]
+        try:
+            self.on_album(parts, key[0], *group.args)
+        except Exception as e:
+            logger.error(f"Failed to forward album {key[1]} from {key[0]}: {e}", exc_info=True)
+
+    def flush_all(self):
+        for key in list(self.groups):
+            self._flush(key)
+
+    def __len__(self):
+        return len(self.groups)
@@ -0,0 +1,54 @@
+"""
+Benchmark for the formatting step of the send path.
+
+"markdown" renders the cleaned entities to Markdown with entities_to_markdown
+and then runs Telethon's Markdown parser over it, which is what
+parse_mode='md' does before every send. "entities" is the native mode: append
+the referral suffix and hand the entities over unchanged.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_formatting
+"""
+
+import time
+
+from telethon.extensions import markdown
+
+from benchmarks.bench_transform import make_message
+from text_transform import remove_urls_and_adjust_entities, entities_to_markdown, append_suffix
+
+SUFFIX = "Register: https://example.com/#/register?invitationCode=123456"
+
+
+def markdown_round_trip(text, entities):
+    md_text = entities_to_markdown(text, entities)
+    return markdown.parse(f"{md_text}\n\n{SUFFIX}")
+
+
+def native_entities(text, entities):
+    return append_suffix(text, entities, SUFFIX)
+
+
+def bench(fn, text, entities, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text, entities)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    print(f"{'segments':>9} {'chars':>8} {'markdown us':>12} {'entities us':>12} {'saved us':>10}")
+    for n in (5, 20, 100, 500):
+        raw_text, raw_entities = make_message(n)
+        text, entities = remove_urls_and_adjust_entities(raw_text, raw_entities)
+        repeat = 50 if n <= 100 else 5
+        md = bench(markdown_round_trip, text, entities, repeat)
+        native = bench(native_entities, text, entities, repeat)
+        print(f"{n:>9} {len(text):>8} {md * 1e6:>12.1f} {native * 1e6:>12.1f} {(md - native) * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Per-message CPU of the update entry points: NewMessage handler vs the
+RAW_UPDATES fast path.
+
+Pre-built UpdateNewChannelMessage objects are pushed through Telethon's own
+dispatcher (TelegramClient._dispatch_update, as the update loop does) on an
+offline client, so the numbers include event building, filtering and our
+handler, up to the point where jobs are handed to the send queues (which
+discard them here). Log output goes to /dev/null but is still formatted.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_raw --messages 20000
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from telethon import events
+from telethon.tl.types import MessageEntityBold, PeerChannel, UpdateNewChannelMessage
+from telethon.tl.types import Message as RawMessage
+
+from benchmarks.bench_replay import configure
+
+CHANNEL_ID = 1234567890
+MARKED_ID = -1000000000000 - CHANNEL_ID
+
+
+class NullDispatcher:
+    def submit(self, target, job, lane="text"):
+        pass
+
+
+def make_updates(n):
+    date = datetime.now(timezone.utc)
+    updates = []
+    for i in range(1, n + 1):
+        text = f"Signal{i} BUY {i % 997} target {i % 991} stop {i % 983} https://example.com/p/{i}"
+        message = RawMessage(
+            id=i, peer_id=PeerChannel(CHANNEL_ID), date=date, message=text,
+            entities=[MessageEntityBold(offset=0, length=len(f"Signal{i}"))]
+        )
+        update = UpdateNewChannelMessage(message=message, pts=i, pts_count=1)
+        # The update loop attaches the entities that came with the update
+        update._entities = {}
+        updates.append(update)
+    return updates
+
+
+async def dispatch_all(tf, updates):
+    client = tf.client
+    takes_one = len(inspect.signature(client._dispatch_update).parameters) == 1
+    started = time.process_time()
+    for update in updates:
+        if takes_one:
+            await client._dispatch_update(update)
+        else:
+            await client._dispatch_update(update, None, None, None)
+    return time.process_time() - started
+
+
+async def run(args):
+    import telegram_forwarder as tf
+    from catchup import CatchUp
+
+    # Offline: make sure Telethon never tries get_me() while dispatching
+    if hasattr(tf.client, "_mb_entity_cache"):
+        tf.client._mb_entity_cache.self_id = 1
+    tf.dispatcher = NullDispatcher()
+    tf.catch_up = CatchUp(tf.client, tf.msg_id_map, tf.peer_cache, 0, 1, 0)
+    tf.catch_up.done.set()
+    tf.peer_cache.add_source("src0", MARKED_ID)
+
+    results = {}
+    for mode, raw, log_every in (("newmessage", False, 1), ("raw", True, 1), ("raw_sampled_logs", True, 100)):
+        tf.RAW_UPDATES = raw
+        tf.MESSAGE_LOG_EVERY = log_every
+        tf.register_handler()
+        for builder, _ in tf.client._event_builders:
+            if isinstance(builder, events.NewMessage):
+                # Resolving the chat filter would need a connection
+                builder.chats = {MARKED_ID}
+                builder.resolved = True
+        updates = make_updates(args.messages)
+        await dispatch_all(tf, updates[:1000])
+        tf.pending_forwards.clear()
+        cpu = await dispatch_all(tf, updates)
+        tf.pending_forwards.clear()
+        results[mode] = round(cpu / args.messages * 1e6, 1)
+
+    return {
+        "messages": args.messages,
+        "cpu_us_per_message": results,
+        "raw_saving": f"{(1 - results['raw'] / results['newmessage']) * 100:.0f}%",
+        "raw_sampled_logs_saving": f"{(1 - results['raw_sampled_logs'] / results['newmessage']) * 100:.0f}%",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        configure(1, 1, workdir)
+        os.environ.update({"OUTBOX_ENABLED": "0", "WATCHDOG_INTERVAL": "0"})
+        import telegram_forwarder  # noqa: F401  (configures logging)
+
+        devnull = open(os.devnull, "w")
+        for handler in logging.getLogger().handlers:
+            handler.setStream(devnull)
+        result = asyncio.run(run(args))
+        devnull.close()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Offline replay benchmark for the whole forwarding pipeline.
+
+Imports telegram_forwarder with a throwaway configuration, swaps every
+account's client for FakeClient and feeds `handler` a message stream, either
+synthetic (text, formatting entities, photos, videos, replies and albums) or
+recorded in a JSONL file. Reports throughput, end-to-end latency percentiles
+(handler call to completed send, overall and per text/media/album) and
+memory growth. Album latency includes the ALBUM_WINDOW wait by design.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_replay --messages 5000
+    python -m benchmarks.bench_replay --stream recorded.jsonl
+
+Recorded streams have one JSON object per line:
+
+    {"source": "src0", "text": "...", "entities": [{"type": "bold", "offset": 0, "length": 4}],
+     "media": {"kind": "photo", "id": 1, "size": 120000}, "reply_to": 12, "grouped_id": 5, "delay": 0.01}
+
+--max-p99-ms (checked against text latency, the one that matters),
+--max-cpu-ms (CPU time per message) and --min-throughput turn the run into a
+regression check that exits non-zero. CI checks latency on a paced feed and
+CPU on an unpaced one; throughput of a paced feed mostly measures the pacing.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from telethon.sessions import StringSession
+from telethon.tl.types import (
+    MessageEntityBold, MessageEntityCode, MessageEntityItalic, MessageEntityTextUrl, MessageEntityUrl
+)
+
+from benchmarks.fake_client import FakeClient, FakeEvent, FakeMessage, make_media
+
+ENTITY_TYPES = {
+    "bold": MessageEntityBold,
+    "italic": MessageEntityItalic,
+    "code": MessageEntityCode,
+    "url": MessageEntityUrl,
+    "text_url": MessageEntityTextUrl,
+}
+
+
+def dummy_session():
+    # A syntactically valid session; it never connects
+    from telethon.crypto import AuthKey
+
+    session = StringSession()
+    session.set_dc(2, "127.0.0.1", 443)
+    session.auth_key = AuthKey(b"\0" * 256)
+    return session.save()
+
+
+def configure(sources, targets_per_source, workdir):
+    targets = [f"dst{i}_{j}" for i in range(sources) for j in range(targets_per_source)]
+    os.environ.update({
+        "STRING_SESSION": dummy_session(),
+        "STRING_SESSIONS": "",
+        "ROUTES_FILE": "",
+        "SOURCE_CHANNELS": ",".join(f"src{i}" for i in range(sources) for _ in range(targets_per_source)),
+        "TARGET_CHANNELS": ",".join(targets),
+        "REFERRAL_LINKS": ",".join(f"https://example.com/?ref={t}" for t in targets),
+        "MSG_MAP_DB": os.path.join(workdir, "message_map.sqlite3"),
+        "CATCHUP_ENABLED": "0",
+        "DEDUP_WINDOW": "0",
+        "SHARD_INDEX": "0",
+        "SHARD_COUNT": "1",
+    })
+
+
+class RecordingHistogram:
+    def __init__(self):
+        self.values = []
+        self.by_kind = {}
+
+    def observe(self, value, target, kind):
+        self.values.append(value)
+        self.by_kind.setdefault(kind, []).append(value)
+
+
+def synthetic_stream(n, sources, seed=0):
+    rng = random.Random(seed)
+    album = album_source = 0
+    for i in range(1, n + 1):
+        words = [f"Signal{i}", "BUY", f"{rng.randint(1, 999)}", "target", f"{rng.randint(1, 999)}"]
+        text = " ".join(words)
+        entities = [{"type": "bold", "offset": 0, "length": len(words[0])}]
+        if i % 3 == 0:
+            url = f"https://example.com/p/{i}"
+            entities.append({"type": "url", "offset": len(text) + 1, "length": len(url)})
+            text += " " + url
+        if i % 5 == 0:
+            text += " 🚀 stop loss " + " ".join("x" * rng.randint(3, 9) for _ in range(rng.randint(5, 40)))
+        item = {"source": f"src{i % sources}", "text": text, "entities": entities}
+        kind = i % 20
+        if kind == 1:
+            item["media"] = {"kind": "photo", "id": i, "size": rng.randint(50_000, 300_000)}
+        elif kind == 2:
+            item["media"] = {"kind": "video", "id": i, "size": rng.randint(1_000_000, 20_000_000)}
+        elif kind in (3, 4, 5):
+            # Three-part album; all parts come from the same source
+            if kind == 3:
+                album += 1
+                album_source = i % sources
+            item["source"] = f"src{album_source}"
+            item["media"] = {"kind": "photo", "id": i, "size": 150_000}
+            item["grouped_id"] = album
+        if i > 10 and i % 7 == 0:
+            item["reply_to"] = i - rng.randint(1, 10)
+        yield item
+
+
+def recorded_stream(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def build_message(msg_id, item):
+    entities = []
+    for ent in item.get("entities") or ():
+        cls = ENTITY_TYPES[ent["type"]]
+        kwargs = {"url": ent.get("url", "https://example.com")} if cls is MessageEntityTextUrl else {}
+        entities.append(cls(offset=ent["offset"], length=ent["length"], **kwargs))
+    media = file = document = None
+    if item.get("media"):
+        media, file, document = make_media(item["media"]["kind"], item["media"]["id"], item["media"]["size"])
+    return FakeMessage(
+        msg_id, item.get("text", ""), entities or None, media, file, document,
+        reply_to_msg_id=item.get("reply_to"), grouped_id=item.get("grouped_id")
+    )
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run(args, stream):
+    import telegram_forwarder as tf
+    from catchup import CatchUp
+    from send_queue import SendDispatcher
+
+    fake = FakeClient(args.send_latency, args.upload_mbps, args.flood_rate, args.flood_seconds)
+    for account in tf.session_pool.accounts:
+        account.client = fake
+        account.peers.client = fake
+    tf.client = fake
+
+    latencies = RecordingHistogram()
+    tf.FORWARD_LATENCY = latencies
+
+    await tf.msg_id_map.open()
+    tf.dispatcher = SendDispatcher(
+        args.target_rate, args.target_rate, args.target_rate * 100, args.target_rate * 100,
+        lane_limits=tf.LANE_LIMITS
+    )
+    tf.catch_up = CatchUp(fake, tf.msg_id_map, tf.peer_cache, 0, 1, 0)
+    tf.catch_up.done.set()
+    for i in range(args.sources):
+        tf.peer_cache.add_source(f"src{i}", -1000 - i)
+
+    tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    fed = 0
+    for msg_id, item in enumerate(stream, 1):
+        source_index = int(item.get("source", "src0")[3:] or 0)
+        await tf.handler(FakeEvent(-1000 - source_index, build_message(msg_id, item)))
+        fed += 1
+        delay = item.get("delay", 1 / args.feed_rate if args.feed_rate else 0)
+        if delay:
+            await asyncio.sleep(delay)
+    while len(tf.albums):
+        await asyncio.sleep(0.05)
+    for queue in list(tf.dispatcher.queues.values()):
+        await queue.queue.join()
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    memory_after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    await tf.dispatcher.close()
+    await tf.msg_id_map.close()
+
+    sends = len(fake.sent)
+    result = {
+        "messages": fed,
+        "sends": sends,
+        "seconds": round(elapsed, 3),
+        "cpu_seconds": round(cpu, 3),
+        "cpu_ms_per_message": round(cpu / fed * 1000, 3) if fed else 0.0,
+        "messages_per_second": round(fed / elapsed, 1),
+        "sends_per_second": round(sends / elapsed, 1),
+        "p50_ms": round(percentile(latencies.values, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies.values, 99) * 1000, 2),
+        **{
+            f"{kind}_p{pct}_ms": round(percentile(values, pct) * 1000, 2)
+            for kind, values in sorted(latencies.by_kind.items())
+            for pct in (50, 99)
+        },
+        "flood_waits": fake.flood_waits,
+        "uploaded_mb": round(fake.uploaded_bytes / 1024 / 1024, 2),
+        "memory_growth_kb": round((memory_after - memory_before) / 1024, 1),
+    }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--sources", type=int, default=4)
+    parser.add_argument("--targets-per-source", type=int, default=2)
+    parser.add_argument("--stream", help="replay a recorded JSONL stream instead of synthetic messages")
+    parser.add_argument("--feed-rate", type=float, default=0.0,
+                        help="synthetic messages per second (0 = one burst); recorded delays take precedence")
+    parser.add_argument("--send-latency", type=float, default=0.005, help="simulated seconds per API call")
+    parser.add_argument("--upload-mbps", type=float, default=50.0)
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="probability of a FloodWaitError per send")
+    parser.add_argument("--flood-seconds", type=int, default=1)
+    parser.add_argument("--target-rate", type=float, default=10000.0, help="per-target send rate limit")
+    parser.add_argument("--fast", action="store_true", help="run on the FAST_RUNTIME event loop (uvloop)")
+    parser.add_argument("--max-p99-ms", type=float, help="fail if the p99 text latency is above this")
+    parser.add_argument("--max-cpu-ms", type=float, help="fail if CPU milliseconds per message are above this")
+    parser.add_argument("--min-throughput", type=float, help="fail if messages/s is below this")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        configure(args.sources, args.targets_per_source, workdir)
+        stream = recorded_stream(args.stream) if args.stream else synthetic_stream(args.messages, args.sources)
+        from runtime import run as run_loop
+
+        result = run_loop(lambda: run(args, stream), fast=args.fast)
+
+    print(json.dumps(result, indent=2))
+    failed = False
+    text_p99 = result.get("text_p99_ms", 0.0)
+    if args.max_p99_ms is not None and text_p99 > args.max_p99_ms:
+        print(f"FAIL: text p99 {text_p99} ms > {args.max_p99_ms} ms")
+        failed = True
+    if args.max_cpu_ms is not None and result["cpu_ms_per_message"] > args.max_cpu_ms:
+        print(f"FAIL: {result['cpu_ms_per_message']} CPU ms/message > {args.max_cpu_ms} ms")
+        failed = True
+    if args.min_throughput is not None and result["messages_per_second"] < args.min_throughput:
+        print(f"FAIL: {result['messages_per_second']} msg/s < {args.min_throughput} msg/s")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
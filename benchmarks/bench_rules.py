@@ -0,0 +1,62 @@
+"""
+Benchmark for the compiled text rule pipeline.
+
+Compares RulePipeline, which joins every rule into one matcher and scans the
+message once, with applying the same rules one after another (one pipeline
+per rule, each rewriting the text and remapping the entities), as the rule
+count grows. The compiled time should stay roughly flat.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_rules
+"""
+
+import time
+
+from benchmarks.bench_transform import make_message
+from text_transform import RulePipeline
+
+WORDS = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliet"]
+
+
+def make_rules(n):
+    return [(f"{WORDS[i % len(WORDS)]}{i}", "x") for i in range(n)]
+
+
+def rule_by_rule(rules):
+    pipelines = [RulePipeline(strip_mentions=True)] + [
+        RulePipeline(strip_urls=False, replacements=[rule]) for rule in rules
+    ]
+
+    def apply(text, entities):
+        for pipeline in pipelines:
+            text, entities = pipeline.apply(text, entities)
+        return text, entities
+    return apply
+
+
+def bench(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    text, entities = make_message(50)
+    print(f"message: {len(text)} chars, {len(entities)} entities")
+    print(f"{'rules':>6} {'rule-by-rule us':>16} {'compiled us':>12}")
+    for n in (0, 10, 50, 200, 1000):
+        rules = make_rules(n)
+        pipeline = RulePipeline(strip_mentions=True, replacements=rules)
+        naive = rule_by_rule(rules)
+        assert naive(text, entities)[0] == pipeline.apply(text, entities)[0]
+        naive_time = bench(lambda: naive(text, entities), 5 if n >= 200 else 20)
+        compiled_time = bench(lambda: pipeline.apply(text, entities), 20)
+        print(f"{n:>6} {naive_time * 1e6:>16.1f} {compiled_time * 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
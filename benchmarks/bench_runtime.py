@@ -0,0 +1,128 @@
+"""
+Default vs FAST_RUNTIME comparison.
+
+  * cold start: wall time of a fresh interpreter importing telegram_forwarder
+    and running an empty main() on the chosen loop (median of --runs);
+  * CPU per MB: process time for Telethon's AES-IGE over --mb megabytes with
+    each available backend (cryptg, libssl, pure Python). This is the
+    MTProto encryption every uploaded or downloaded byte goes through;
+  * loop CPU: process time of the replay benchmark on asyncio vs uvloop.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_runtime
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_replay import dummy_session
+
+COLD_START = """
+import telegram_forwarder as tf
+from runtime import run
+
+async def main():
+    pass
+
+run(main, fast=tf.FAST_RUNTIME)
+"""
+
+
+def child_env(fast, workdir):
+    env = dict(os.environ)
+    env.update({
+        "FAST_RUNTIME": "1" if fast else "0",
+        "STRING_SESSION": dummy_session(),
+        "ROUTES_FILE": "",
+        "SOURCE_CHANNELS": "src0",
+        "TARGET_CHANNELS": "dst0",
+        "REFERRAL_LINKS": "https://example.com/?ref=1",
+        "MSG_MAP_DB": os.path.join(workdir, "message_map.sqlite3"),
+    })
+    return env
+
+
+def cold_start(fast, runs, workdir):
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", COLD_START], env=child_env(fast, workdir),
+            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def aes_cpu_per_mb(mb):
+    from telethon.crypto import aes, libssl
+
+    key, iv = os.urandom(32), os.urandom(32)
+    backends = {}
+    saved = aes.cryptg, libssl.encrypt_ige
+    try:
+        if saved[0] is not None:
+            backends["cryptg"] = (saved[0], saved[1])
+        if saved[1] is not None:
+            backends["libssl"] = (None, saved[1])
+        backends["python"] = (None, None)
+
+        results = {}
+        for name, (cryptg, encrypt) in backends.items():
+            aes.cryptg, libssl.encrypt_ige = cryptg, encrypt
+            # The pure-Python backend is too slow for full megabytes
+            size = int(mb * 1024 * 1024) if name != "python" else 64 * 1024
+            data = os.urandom(size - size % 16)
+            started = time.process_time()
+            aes.AES.encrypt_ige(data, key, iv)
+            results[name] = round((time.process_time() - started) / (len(data) / 1024 / 1024), 4)
+        return results
+    finally:
+        aes.cryptg, libssl.encrypt_ige = saved
+
+
+def replay_cpu(fast, messages):
+    args = [sys.executable, "-m", "benchmarks.bench_replay", "--messages", str(messages), "--feed-rate", "0"]
+    if fast:
+        args.append("--fast")
+    output = subprocess.run(args, check=True, capture_output=True, text=True).stdout
+    result = json.loads(output[output.index("{"):output.rindex("}") + 1])
+    return round(result["cpu_seconds"] / result["messages"] * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--mb", type=float, default=8)
+    parser.add_argument("--messages", type=int, default=2000)
+    args = parser.parse_args()
+
+    from runtime import fast_runtime_problem
+
+    problem = fast_runtime_problem()
+    if problem:
+        print(f"Fast runtime unavailable, only the default mode is measured: {problem}")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        modes = [False] if problem else [False, True]
+        result = {
+            "cold_start_seconds": {
+                ("fast" if fast else "default"): round(cold_start(fast, args.runs, workdir), 3) for fast in modes
+            },
+            "aes_cpu_seconds_per_mb": aes_cpu_per_mb(args.mb),
+            "replay_cpu_seconds_per_1000_messages": {
+                ("fast" if fast else "default"): replay_cpu(fast, args.messages) for fast in modes
+            },
+        }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Micro-benchmark for remove_urls_and_adjust_entities.
+
+Compares the current single-pass implementation against the original
+quadratic one (kept below as `legacy_remove_urls`) on large synthetic posts,
+and checks that both produce the same output on inputs where the original was
+correct (BMP-only text, no entity overlapping a removed URL).
+
+Run from the repository root:
+
+    python -m benchmarks.bench_transform
+"""
+
+import random
+import re
+import time
+
+from telethon.tl.types import (
+    MessageEntityBold, MessageEntityItalic, MessageEntityTextUrl, MessageEntityUrl
+)
+
+from text_transform import remove_urls_and_adjust_entities
+
+URL_PATTERN = re.compile(r'https?://\S+')
+
+
+def legacy_remove_urls(text, entities):
+    if not text:
+        return None, None
+
+    url_spans = []
+    if entities:
+        for ent in entities:
+            if isinstance(ent, (MessageEntityTextUrl, MessageEntityUrl)):
+                url_spans.append((ent.offset, ent.offset + ent.length))
+
+    covered_spans = set()
+    for start, end in url_spans:
+        covered_spans.update(range(start, end))
+
+    for match in URL_PATTERN.finditer(text):
+        start, end = match.span()
+        if not any(pos in covered_spans for pos in range(start, end)):
+            url_spans.append((start, end))
+
+    url_spans = sorted(url_spans, key=lambda x: x[0], reverse=True)
+
+    cleaned_text = text
+    for start, end in url_spans:
+        cleaned_text = cleaned_text[:start] + cleaned_text[end:]
+
+    adjusted_entities = []
+    for ent in entities or []:
+        if isinstance(ent, (MessageEntityTextUrl, MessageEntityUrl)):
+            continue
+
+        removed_before = 0
+        for start, end in url_spans:
+            if start < ent.offset:
+                removed_before += (end - start)
+
+        new_offset = ent.offset - removed_before
+        if new_offset < 0:
+            continue
+
+        new_length = ent.length
+        if new_offset + new_length > len(cleaned_text):
+            new_length = len(cleaned_text) - new_offset
+            if new_length <= 0:
+                continue
+
+        new_ent = type(ent)(
+            offset=new_offset,
+            length=new_length,
+            **{k: v for k, v in vars(ent).items() if k not in ('offset', 'length')}
+        )
+        adjusted_entities.append(new_ent)
+
+    cleaned_text = cleaned_text.strip()
+    return cleaned_text if cleaned_text else None, adjusted_entities if adjusted_entities else None
+
+
+def make_message(n_segments, seed=0):
+    """
+    Build a post of `n_segments` chunks, each a formatted word, some filler and
+    either a bare URL, a URL entity or a text link.
+    """
+    rng = random.Random(seed)
+    parts = []
+    entities = []
+    pos = 0
+    for i in range(n_segments):
+        word = f"Signal{i}"
+        entities.append((MessageEntityBold if i % 2 else MessageEntityItalic)(offset=pos, length=len(word)))
+        filler = f"{word} entry {rng.randint(1, 999)} target {rng.randint(1, 999)} "
+        parts.append(filler)
+        pos += len(filler)
+
+        url = f"https://example.com/p/{i}?ref={rng.randint(1000, 9999)}"
+        kind = i % 3
+        if kind == 1:
+            entities.append(MessageEntityUrl(offset=pos, length=len(url)))
+        elif kind == 2:
+            entities.append(MessageEntityTextUrl(offset=pos, length=len(url), url=url))
+        parts.append(url + "\n")
+        pos += len(url) + 1
+    return "".join(parts), entities
+
+
+def as_tuples(result):
+    text, entities = result
+    return text, [(type(e).__name__, e.offset, e.length) for e in entities or ()]
+
+
+def bench(fn, text, entities, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text, entities)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    print(f"{'segments':>9} {'chars':>8} {'legacy ms':>10} {'current ms':>11} {'speedup':>8}")
+    for n in (10, 100, 500, 2000):
+        text, entities = make_message(n)
+        assert as_tuples(remove_urls_and_adjust_entities(text, entities)) == \
+            as_tuples(legacy_remove_urls(text, entities)), f"output mismatch at {n} segments"
+
+        repeat = 20 if n <= 500 else 3
+        legacy = bench(legacy_remove_urls, text, entities, repeat)
+        current = bench(remove_urls_and_adjust_entities, text, entities, repeat)
+        print(f"{n:>9} {len(text):>8} {legacy * 1000:>10.3f} {current * 1000:>11.3f} {legacy / current:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
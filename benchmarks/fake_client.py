@@ -0,0 +1,131 @@
+"""
+Offline stand-ins for Telethon objects, used by the replay benchmark.
+
+FakeClient implements the few TelegramClient methods the forwarder calls.
+It records every send, sleeps to simulate network and upload latency, and
+can raise FloodWaitError at a configurable rate. FakeMessage and FakeEvent
+carry the attributes the handler reads.
+"""
+
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+
+from telethon.errors import FloodWaitError
+from telethon.tl.types import (
+    Document, DocumentAttributeFilename, MessageMediaDocument, MessageMediaPhoto, Photo
+)
+
+
+class FakeFile:
+    __slots__ = ("size", "name", "ext")
+
+    def __init__(self, size, name, ext):
+        self.size = size
+        self.name = name
+        self.ext = ext
+
+
+def make_media(kind, media_id, size):
+    if kind == "photo":
+        photo = Photo(id=media_id, access_hash=0, file_reference=b"", date=None, sizes=[], dc_id=1)
+        return MessageMediaPhoto(photo=photo), FakeFile(size, None, ".jpg"), None
+    document = Document(
+        id=media_id, access_hash=0, file_reference=b"", date=None, mime_type="video/mp4",
+        size=size, dc_id=1, attributes=[DocumentAttributeFilename(f"{media_id}.mp4")]
+    )
+    return MessageMediaDocument(document=document), FakeFile(size, f"{media_id}.mp4", ".mp4"), document
+
+
+class FakeMessage:
+    def __init__(self, msg_id, text, entities=None, media=None, file=None, document=None,
+                 reply_to_msg_id=None, grouped_id=None, date=None):
+        self.id = msg_id
+        self.message = text
+        self.entities = entities
+        self.media = media
+        self.file = file
+        self.document = document
+        self.reply_to_msg_id = reply_to_msg_id
+        self.grouped_id = grouped_id
+        self.date = date or datetime.now(timezone.utc)
+
+
+class FakeEvent:
+    def __init__(self, chat_id, message):
+        self.chat_id = chat_id
+        self.message = message
+
+    async def get_chat(self):
+        raise RuntimeError("the benchmark registers every source up front")
+
+
+class SentMessage:
+    __slots__ = ("id", "media", "chat", "sent_at")
+
+    def __init__(self, msg_id, chat, media=None):
+        self.id = msg_id
+        self.chat = chat
+        self.media = media
+        self.sent_at = time.perf_counter()
+
+
+class FakeClient:
+    def __init__(self, send_latency=0.02, upload_mbps=20.0, flood_rate=0.0, flood_seconds=1, seed=0):
+        self.send_latency = send_latency
+        self.upload_mbps = upload_mbps
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.rng = random.Random(seed)
+        self.next_id = 1
+        self.sent = []
+        self.flood_waits = 0
+        self.uploaded_bytes = 0
+
+    def is_connected(self):
+        return True
+
+    def _maybe_flood(self):
+        if self.flood_rate and self.rng.random() < self.flood_rate:
+            self.flood_waits += 1
+            raise FloodWaitError(request=None, capture=self.flood_seconds)
+
+    def _record(self, chat, media=None):
+        sent = SentMessage(self.next_id, chat, media)
+        self.next_id += 1
+        self.sent.append(sent)
+        return sent
+
+    async def send_message(self, entity, message, **kwargs):
+        self._maybe_flood()
+        await asyncio.sleep(self.send_latency)
+        return self._record(entity)
+
+    async def send_file(self, entity, file, **kwargs):
+        self._maybe_flood()
+        files = file if isinstance(file, list) else [file]
+        delay = self.send_latency
+        for item in files:
+            # Media sent by reference costs no upload; raw bytes/handles do
+            if not isinstance(item, (MessageMediaPhoto, MessageMediaDocument)):
+                size = len(item) if isinstance(item, bytes) else getattr(item, "size", 0)
+                delay += size / (self.upload_mbps * 1024 * 1024)
+                self.uploaded_bytes += size
+        await asyncio.sleep(delay)
+        sent = [self._record(entity, item if isinstance(item, (MessageMediaPhoto, MessageMediaDocument)) else None)
+                for item in files]
+        return sent if isinstance(file, list) else sent[0]
+
+    async def download_media(self, message, file=None):
+        await asyncio.sleep((message.file.size or 0) / (self.upload_mbps * 1024 * 1024))
+        return b"\0" * min(message.file.size or 0, 1024)
+
+    async def upload_file(self, data, file_name=None):
+        return data
+
+    async def get_input_entity(self, key):
+        return key
+
+    async def get_entity(self, key):
+        return key
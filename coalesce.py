@@ -0,0 +1,83 @@
+"""
+Burst coalescing.
+
+Some sources post a burst of short texts within seconds. On routes with
+`coalesce` set, consecutive text messages from one source to one target are
+held for at most that many seconds (counted from the first of the batch) and
+then handed to `on_flush(route, source, messages, prepared)` together, to be
+sent as a single message with the suffix once. A batch is flushed early when
+the next message would take the merged text and suffix past Telegram's
+4096-character limit.
+"""
+
+import asyncio
+import logging
+
+from text_transform import utf16_len
+
+logger = logging.getLogger(__name__)
+
+# Telegram's limit for a message text, in UTF-16 code units
+MAX_MESSAGE_LENGTH = 4096
+
+# Put between the merged texts; join_texts() must use the same
+SEPARATOR = "\n\n"
+
+
+class _Batch:
+    __slots__ = ("route", "messages", "prepared", "length", "timer")
+
+    def __init__(self, route):
+        self.route = route
+        self.messages = []
+        self.prepared = []
+        self.length = 0
+        self.timer = None
+
+
+class Coalescer:
+    def __init__(self, on_flush, limit=MAX_MESSAGE_LENGTH):
+        self.on_flush = on_flush
+        self.limit = limit
+        self.batches = {}
+
+    def add(self, route, source, message, prepared):
+        """Buffer a text message for `route`, whose `coalesce` is the window in seconds."""
+        key = (source, route.target)
+        length = utf16_len(prepared[0])
+        batch = self.batches.get(key)
+        if batch is not None:
+            merged = batch.length + utf16_len(SEPARATOR) + length
+            if merged + utf16_len(SEPARATOR) + utf16_len(route.suffix) > self.limit:
+                self._flush(key)
+                batch = None
+        if batch is None:
+            batch = self.batches[key] = _Batch(route)
+            batch.timer = asyncio.get_running_loop().call_later(route.coalesce, self._flush, key)
+            batch.length = length
+        else:
+            batch.length = merged
+        batch.messages.append(message)
+        batch.prepared.append(prepared)
+
+    def flush(self, source, target):
+        """Send what is buffered for (source, target) now, e.g. before a message that isn't merged."""
+        if (source, target) in self.batches:
+            self._flush((source, target))
+
+    def _flush(self, key):
+        batch = self.batches.pop(key, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        try:
+            self.on_flush(batch.route, key[0], batch.messages, batch.prepared)
+        except Exception as e:
+            logger.error(f"Failed to forward {len(batch.messages)} merged messages from {key[0]}: {e}", exc_info=True)
+
+    def flush_all(self):
+        for key in list(self.batches):
+            self._flush(key)
+
+    def __len__(self):
+        return len(self.batches)
@@ -0,0 +1,86 @@
+"""
+Watches the routes file and reloads it while the forwarder keeps running.
+
+The file's modification time and size are polled; a change triggers a
+reload a moment later (editors often write in several steps). A file that
+fails to parse is reported and ignored, so a typo never takes down the
+routes that are already running. SIGHUP forces a reload as well.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigWatcher:
+    def __init__(self, path, load, on_change, interval=2.0, settle=0.5):
+        self.path = path
+        self.load = load
+        self.on_change = on_change
+        self.interval = interval
+        self.settle = settle
+        self.reloads = 0
+        self.failures = 0
+        self._stamp = self._read_stamp()
+        self._wake = None
+        self._task = None
+
+    def _read_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    async def reload(self):
+        """Load the file and hand the new value to on_change; False if it didn't load."""
+        try:
+            value = self.load(self.path)
+        except ValueError as e:
+            self.failures += 1
+            logger.error(f"❌ Not reloading {self.path}, keeping the current routes: {e}")
+            return False
+        await self.on_change(value)
+        self.reloads += 1
+        return True
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+                forced = True
+            except asyncio.TimeoutError:
+                forced = False
+            self._wake.clear()
+
+            stamp = self._read_stamp()
+            if not forced and (stamp is None or stamp == self._stamp):
+                continue
+            await asyncio.sleep(self.settle)
+            self._stamp = self._read_stamp()
+            logger.info(f"🔄 {self.path} changed, reloading")
+            try:
+                await self.reload()
+            except Exception as e:
+                logger.error(f"Applying {self.path} failed: {e}", exc_info=True)
+
+    def start(self):
+        self._wake = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, self._wake.set)
+        except (NotImplementedError, AttributeError, RuntimeError):
+            # No SIGHUP on Windows; polling still works
+            pass
+        logger.info(f"Watching {self.path} for route changes every {self.interval:g}s")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
@@ -0,0 +1,77 @@
+"""
+Cross-source duplicate suppression.
+
+Sources often repost the same signal within seconds. After URL stripping,
+each message is reduced to a fingerprint of its normalized text plus the ID
+of its photo/document, and a target that already received the same
+fingerprint within the window doesn't get it again.
+
+A fingerprint only starts its window once the send succeeded (`sent`);
+while the send is queued it is held as in flight, so a repost arriving
+meanwhile is still suppressed, and a send that fails or is dropped
+(`release`) doesn't block a later repost.
+
+Entries live in an insertion-ordered dict; with a fixed TTL the oldest entry
+is always the first to expire, so expiry only looks at the front. The dict
+is capped at `max_entries`, which bounds memory regardless of traffic.
+"""
+
+import hashlib
+import re
+import time
+from collections import OrderedDict
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(text, media_id=None):
+    normalized = _WHITESPACE.sub(" ", (text or "").strip().casefold())
+    digest = hashlib.blake2b(normalized.encode(), digest_size=16)
+    if media_id is not None:
+        digest.update(repr(media_id).encode())
+    return digest.digest()
+
+
+class DedupCache:
+    def __init__(self, window, max_entries=100000):
+        self.window = window
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.in_flight = set()
+
+    def _expire(self, now):
+        entries = self.entries
+        while entries:
+            key, expires = next(iter(entries.items()))
+            if expires > now:
+                break
+            entries.popitem(last=False)
+
+    def seen(self, target, digest):
+        """
+        True if `digest` was sent to `target` within the window or is being
+        sent now; otherwise marks it as in flight and returns False.
+        """
+        if self.window <= 0:
+            return False
+        self._expire(time.monotonic())
+        key = (target, digest)
+        if key in self.entries or key in self.in_flight:
+            return True
+        self.in_flight.add(key)
+        return False
+
+    def sent(self, target, digest):
+        """Start the window of an in-flight `digest` now that it reached `target`."""
+        if self.window <= 0:
+            return
+        key = (target, digest)
+        self.in_flight.discard(key)
+        self.entries[key] = time.monotonic() + self.window
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def release(self, target, digest):
+        """Forget an in-flight `digest` whose send failed or was dropped."""
+        self.in_flight.discard((target, digest))
@@ -0,0 +1,53 @@
+"""
+Delete batching.
+
+A source removing several posts produces one or more MessageDeleted updates
+in quick succession. The batcher collects the deleted IDs per target until
+`window` seconds have passed since the first one (or Telegram's 100-ID limit
+is reached) and then hands them to `on_flush(target, items)` as a list of
+(source, message_id) pairs, so each target gets a single delete_messages.
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Telegram doesn't accept more than 100 IDs per delete_messages request
+MAX_DELETE_IDS = 100
+
+
+class DeleteBatcher:
+    def __init__(self, window, on_flush):
+        self.window = window
+        self.on_flush = on_flush
+        self.pending = {}
+        self.timers = {}
+
+    def add(self, target, source, msg_ids):
+        items = self.pending.setdefault(target, [])
+        items.extend((source, msg_id) for msg_id in msg_ids)
+        if len(items) >= MAX_DELETE_IDS:
+            self._flush(target)
+        elif target not in self.timers:
+            self.timers[target] = asyncio.get_running_loop().call_later(self.window, self._flush, target)
+
+    def _flush(self, target):
+        timer = self.timers.pop(target, None)
+        if timer is not None:
+            timer.cancel()
+        items = self.pending.pop(target, None)
+        if not items:
+            return
+        for start in range(0, len(items), MAX_DELETE_IDS):
+            try:
+                self.on_flush(target, items[start:start + MAX_DELETE_IDS])
+            except Exception as e:
+                logger.error(f"Failed to propagate deletes to {target}: {e}", exc_info=True)
+
+    def flush_all(self):
+        for target in list(self.pending):
+            self._flush(target)
+
+    def __len__(self):
+        return sum(len(items) for items in self.pending.values())
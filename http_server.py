@@ -0,0 +1,69 @@
+"""
+Tiny HTTP server running on the forwarder's own event loop.
+
+It only understands plain GET requests and closes the connection after
+every response, which is all a metrics scraper or a health check needs.
+Routes map a path to a callable returning (status, content_type, body).
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+REASONS = {200: "OK", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class HttpServer:
+    def __init__(self, host, port, routes):
+        self.host = host
+        self.port = port
+        self.routes = routes
+        self.server = None
+
+    async def _respond(self, writer, status, content_type, body):
+        if isinstance(body, str):
+            body = body.encode()
+        head = (
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        writer.write(head.encode() + body)
+        await writer.drain()
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=10)
+            # Drain the headers; nothing in them is needed
+            while (await asyncio.wait_for(reader.readline(), timeout=10)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) < 2:
+                return
+            method, path = parts[0], parts[1].split("?", 1)[0]
+            route = self.routes.get(path)
+            if route is None:
+                await self._respond(writer, 404, "text/plain", "Not Found")
+            elif method not in ("GET", "HEAD"):
+                await self._respond(writer, 405, "text/plain", "Method Not Allowed")
+            else:
+                status, content_type, body = route()
+                await self._respond(writer, status, content_type, b"" if method == "HEAD" else body)
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error(f"HTTP handler error: {e}", exc_info=True)
+            await self._respond(writer, 500, "text/plain", "Internal Server Error")
+        finally:
+            writer.close()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"HTTP server listening on {self.host}:{self.port} ({', '.join(self.routes)})")
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
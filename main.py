@@ -1,22 +1,7 @@
-from flask import Flask
-from threading import Thread
-import subprocess
-import os
+import runner
 
-app = Flask(__name__)
-
-@app.route('/')
-def home():
-    return "✅ Bot is alive!"
-
-def run_flask():
-    port = int(os.environ.get("PORT", 10000))
-    app.run(host="0.0.0.0", port=port)
-
-def run_runner():
-    subprocess.run(["python", "runner.py"])
-
-# Start Flask in one thread and runner.py in another
+# The forwarder shards serve their own health endpoints (the first shard
+# that runs on PORT, the next on PORT + 1, ...), so this entry point only
+# runs the supervisor.
 if __name__ == "__main__":
-    Thread(target=run_flask).start()
-    run_runner()
+    runner.main()
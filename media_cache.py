@@ -0,0 +1,200 @@
+"""
+Media fan-out for the forwarder.
+
+Photos and documents are sent by reference whenever possible: Telethon turns
+the source MessageMedia into an InputMedia that points at the file already
+stored on Telegram's servers, so nothing is uploaded. Once a copy has been
+sent to a target, the media of that sent message (with a fresh file
+reference) is cached by photo/document ID and used for later sends.
+
+Only when Telegram refuses the reference (expired reference, or a source with
+protected content) is the file downloaded and uploaded again, once per file,
+and the resulting copy reused for every other destination.
+
+Albums go out as one send_file call with a list of files, using the same
+cached handles; if Telegram refuses the album, every part is uploaded again
+with its original attributes.
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+
+from telethon.errors import (
+    ChatForwardsRestrictedError, FileReferenceExpiredError,
+    FileReferenceInvalidError, MediaEmptyError
+)
+from telethon.tl.types import (
+    InputMediaUploadedDocument, InputMediaUploadedPhoto,
+    MessageMediaDocument, MessageMediaEmpty, MessageMediaPhoto,
+    MessageMediaUnsupported, MessageMediaWebPage
+)
+
+logger = logging.getLogger(__name__)
+
+# Errors meaning "this file reference can't be used here, upload it instead"
+REUPLOAD_ERRORS = (
+    ChatForwardsRestrictedError, FileReferenceExpiredError,
+    FileReferenceInvalidError, MediaEmptyError
+)
+
+
+def media_key(media):
+    """
+    Stable cache key for photo/document media, or None for anything that
+    can't be re-sent as a file (web page previews, polls, ...).
+    """
+    if isinstance(media, MessageMediaPhoto) and media.photo:
+        return ("photo", media.photo.id)
+    if isinstance(media, MessageMediaDocument) and media.document:
+        return ("document", media.document.id)
+    return None
+
+
+def is_sendable(media):
+    """
+    True for media that is forwarded with send_file: files, and also polls,
+    locations, contacts, dice, ... (sent by reference, without caching).
+    Web page previews belong to the text and are sent as text.
+    """
+    return media is not None and not isinstance(
+        media, (MessageMediaWebPage, MessageMediaEmpty, MessageMediaUnsupported)
+    )
+
+
+class MediaCache:
+    """
+    Bounded LRU of file handles reusable for sending, keyed by media_key().
+    """
+
+    def __init__(self, max_entries=2000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.locks = {}
+
+    def get(self, key):
+        handle = self.entries.get(key)
+        if handle is not None:
+            self.entries.move_to_end(key)
+        return handle
+
+    def put(self, key, handle):
+        self.entries[key] = handle
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def discard(self, key):
+        self.entries.pop(key, None)
+
+    def lock(self, key):
+        lock = self.locks.get(key)
+        if lock is None:
+            lock = self.locks[key] = asyncio.Lock()
+        return lock
+
+
+class MediaSender:
+    def __init__(self, cache):
+        self.cache = cache
+        self.uploads = 0
+        self.reuses = 0
+
+    async def _upload(self, client, source_client, message):
+        # The source message's file can only be downloaded by the account that received it
+        data = await source_client.download_media(message, file=bytes)
+        name = message.file.name or f"file{message.file.ext or ''}"
+        self.uploads += 1
+        return await client.upload_file(data, file_name=name)
+
+    async def _upload_media(self, client, source_client, message):
+        """Upload the file of `message` as InputMedia that keeps its attributes and MIME type."""
+        uploaded = await self._upload(client, source_client, message)
+        if isinstance(message.media, MessageMediaPhoto):
+            return InputMediaUploadedPhoto(file=uploaded)
+        return InputMediaUploadedDocument(
+            file=uploaded,
+            mime_type=message.document.mime_type,
+            attributes=message.document.attributes,
+        )
+
+    def _remember(self, key, sent_msg):
+        if sent_msg is not None and media_key(sent_msg.media) is not None:
+            self.cache.put(key, sent_msg.media)
+
+    async def send(self, client, target, message, source_client=None, **kwargs):
+        """
+        send_file() the media of `message` to `target`, reusing a cached or
+        existing file reference and only uploading when Telegram insists.
+        `source_client` is the account that received `message`, if different.
+        """
+        key = media_key(message.media)
+        if key is None:
+            # Polls, locations, ... have no file to cache or upload again
+            return await client.send_file(target, file=message.media, **kwargs)
+        handle = self.cache.get(key)
+        if handle is not None:
+            try:
+                self.reuses += 1
+                return await client.send_file(target, file=handle, **kwargs)
+            except REUPLOAD_ERRORS:
+                self.cache.discard(key)
+
+        try:
+            sent_msg = await client.send_file(target, file=message.media, **kwargs)
+            self._remember(key, sent_msg)
+            return sent_msg
+        except REUPLOAD_ERRORS as e:
+            logger.info(f"Re-uploading {key[0]} {key[1]} ({type(e).__name__})")
+
+        # Every target of this file waits here, so it is only uploaded once
+        async with self.cache.lock(key):
+            handle = self.cache.get(key)
+            if handle is not None:
+                return await client.send_file(target, file=handle, **kwargs)
+
+            uploaded = await self._upload(client, source_client or client, message)
+            is_photo = key[0] == "photo"
+            # The original attributes and MIME type keep videos, GIFs and voice
+            # notes what they were instead of turning them into plain files
+            sent_msg = await client.send_file(
+                target,
+                file=uploaded,
+                force_document=False,
+                attributes=None if is_photo else message.document.attributes,
+                mime_type=None if is_photo else message.document.mime_type,
+                **kwargs
+            )
+            self._remember(key, sent_msg)
+        self.cache.locks.pop(key, None)
+        return sent_msg
+
+    async def send_album(self, client, target, messages, source_client=None, **kwargs):
+        """
+        send_file() the media of all `messages` to `target` as one album.
+        Returns the list of sent messages, in the same order.
+        """
+        keys = [media_key(message.media) for message in messages]
+        files = []
+        for key, message in zip(keys, messages):
+            handle = self.cache.get(key)
+            if handle is not None:
+                self.reuses += 1
+            files.append(handle or message.media)
+
+        try:
+            sent = await client.send_file(target, file=files, **kwargs)
+        except REUPLOAD_ERRORS as e:
+            logger.info(f"Re-uploading album of {len(messages)} ({type(e).__name__})")
+            for key in keys:
+                self.cache.discard(key)
+            # Uploaded files expire, so only the sent copies are cached below
+            files = [
+                await self._upload_media(client, source_client or client, message)
+                for message in messages
+            ]
+            sent = await client.send_file(target, file=files, **kwargs)
+
+        for key, sent_msg in zip(keys, sent):
+            self._remember(key, sent_msg)
+        return sent
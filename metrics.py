@@ -0,0 +1,165 @@
+"""
+Minimal Prometheus metrics for the forwarder.
+
+Everything is updated from the event loop thread only, so the metric objects
+are plain dicts and lists with no locking. Histograms keep per-bucket counts
+(not cumulative) so an observation is a single bisect and increment; the
+cumulative sums are only computed when /metrics is scraped.
+"""
+
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 300)
+STAGE_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def inc(self, *label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        for label_values, value in self.values.items():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+class Gauge:
+    """A gauge whose samples are read from `collect()` at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=(), collect=None):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.collect = collect
+
+    def render(self):
+        if self.collect is None:
+            return
+        for label_values, value in self.collect():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets, labels=()):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        # label values -> [per-bucket counts (+1 for +Inf), sum, count]
+        self.series = {}
+
+    def observe(self, value, *label_values):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        for label_values, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                labels = _format_labels(self.labels, label_values, f'le="{le}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+FORWARD_LATENCY = REGISTRY.register(Histogram(
+    "forwarder_latency_seconds",
+    "Time from the source post (message.date) to the completed send to a target.",
+    LATENCY_BUCKETS,
+    labels=("target", "kind")
+))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "forwarder_stage_seconds",
+    "Time spent per pipeline stage.",
+    STAGE_BUCKETS,
+    labels=("stage",)
+))
+FLOOD_WAIT_SECONDS = REGISTRY.register(Counter(
+    "forwarder_flood_wait_seconds_total",
+    "Seconds of flood wait requested by Telegram.",
+    labels=("target",)
+))
+DROPPED = REGISTRY.register(Counter(
+    "forwarder_dropped_total",
+    "Messages that were not forwarded, by reason.",
+    labels=("reason",)
+))
+FORWARDED = REGISTRY.register(Counter(
+    "forwarder_forwarded_total",
+    "Messages sent to targets.",
+    labels=("target", "kind")
+))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "forwarder_queue_depth",
+    "Jobs waiting in a target's send queue.",
+    labels=("target",)
+))
+RECONNECTS = REGISTRY.register(Counter(
+    "forwarder_reconnects_total",
+    "In-process reconnects after a stalled connection, per account.",
+    labels=("account",)
+))
+PING_RTT = REGISTRY.register(Gauge(
+    "forwarder_ping_rtt_seconds",
+    "Round trip of the latest MTProto ping, per account.",
+    labels=("account",)
+))
+PROPAGATED = REGISTRY.register(Counter(
+    "forwarder_propagated_total",
+    "Source edits and deletes applied to forwarded copies.",
+    labels=("target", "kind")
+))
@@ -0,0 +1,244 @@
+"""
+Source -> target message-ID mapping used to keep reply threads intact.
+
+Entries are keyed by (source, source message id, target) so IDs from different
+source channels never collide. Lookups hit a bounded in-memory LRU first and
+fall back to an SQLite file on disk, which survives the restarts done by
+runner.py. Writes only touch memory on the hot path; a background task flushes
+them to disk in batches.
+
+The same database keeps a per-source cursor: the ID of the newest message
+forwarded from each source, used to catch up on the gap after a restart.
+
+It also holds the outbox: every forward is journaled before it is sent and
+acknowledged afterwards, so forwards cut off by a crash are replayed on the
+next start. Journal entries wake the flusher at once and everything queued
+meanwhile goes into the same commit (group commit). Acks are written in the
+same transaction as the message mapping, so an acknowledged forward always
+has its mapping on disk, which is what the replay checks against to avoid
+posting twice.
+"""
+
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class MessageIdStore:
+    def __init__(self, path, cache_size=50000, max_rows=1000000, flush_interval=1.0, batch_size=500):
+        self.path = path
+        self.cache_size = cache_size
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self.cache = OrderedDict()
+        self.pending = []
+        self.cursors = {}
+        self.dirty_cursors = set()
+        self.journal_pending = []
+        self.acks = []
+        self.db = None
+        # A single thread owns the connection, so all disk access is serialized
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="msg-store")
+        self.flush_task = None
+        self.flush_event = None
+        self.flushes = 0
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def _open_db(self):
+        # Shard processes share the file; WAL plus a busy timeout serializes their writes
+        db = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS message_map ("
+            " source TEXT NOT NULL,"
+            " source_msg_id INTEGER NOT NULL,"
+            " target TEXT NOT NULL,"
+            " target_msg_id INTEGER NOT NULL,"
+            " created INTEGER NOT NULL,"
+            " PRIMARY KEY (source, source_msg_id, target)"
+            ") WITHOUT ROWID"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS message_map_created ON message_map (created)")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS source_cursor ("
+            " source TEXT PRIMARY KEY,"
+            " last_msg_id INTEGER NOT NULL"
+            ")"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " source TEXT NOT NULL,"
+            " source_msg_id INTEGER NOT NULL,"
+            " target TEXT NOT NULL,"
+            " created INTEGER NOT NULL,"
+            " PRIMARY KEY (source, source_msg_id, target)"
+            ") WITHOUT ROWID"
+        )
+        db.commit()
+        return db
+
+    def _load_cursors(self):
+        return dict(self.db.execute("SELECT source, last_msg_id FROM source_cursor"))
+
+    async def open(self):
+        self.db = await self._run(self._open_db)
+        self.cursors = await self._run(self._load_cursors)
+        self.flush_event = asyncio.Event()
+        self.flush_task = asyncio.get_running_loop().create_task(self._flusher())
+        logger.info(f"Message map store opened at {self.path}")
+
+    def _remember(self, key, value):
+        self.cache[key] = value
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def put(self, source, source_msg_id, target, target_msg_id):
+        key = (str(source), source_msg_id, str(target))
+        self._remember(key, target_msg_id)
+        self.pending.append(key + (target_msg_id, int(time.time())))
+        if len(self.pending) >= self.batch_size:
+            self.flush_event.set()
+
+    def get_cursor(self, source):
+        return self.cursors.get(str(source))
+
+    def advance_cursor(self, source, msg_id):
+        source = str(source)
+        if msg_id > self.cursors.get(source, 0):
+            self.cursors[source] = msg_id
+            self.dirty_cursors.add(source)
+
+    def journal(self, source, source_msg_id, target):
+        """
+        Record a forward that is about to be sent. Returns a future that is
+        done once the entry has been committed.
+        """
+        committed = asyncio.get_running_loop().create_future()
+        self.journal_pending.append(((str(source), source_msg_id, str(target), int(time.time())), committed))
+        self.flush_event.set()
+        return committed
+
+    def ack(self, source, source_msg_id, target):
+        """Mark a journaled forward as finished (sent or given up on)."""
+        self.acks.append((str(source), source_msg_id, str(target)))
+
+    def _select_unacked(self):
+        return self.db.execute(
+            "SELECT source, source_msg_id, target FROM outbox ORDER BY source, source_msg_id"
+        ).fetchall()
+
+    async def unacked(self):
+        """Journaled forwards that were never acknowledged, oldest first per source."""
+        return await self._run(self._select_unacked)
+
+    def _select(self, key):
+        row = self.db.execute(
+            "SELECT target_msg_id FROM message_map WHERE source = ? AND source_msg_id = ? AND target = ?",
+            key
+        ).fetchone()
+        return row[0] if row else None
+
+    async def get(self, source, source_msg_id, target):
+        key = (str(source), source_msg_id, str(target))
+        value = self.cache.get(key)
+        if value is not None:
+            self.cache.move_to_end(key)
+            return value
+        if self.db is None:
+            return None
+        value = await self._run(self._select, key)
+        if value is not None:
+            self._remember(key, value)
+        return value
+
+    def _write(self, rows, cursors, journal, acks):
+        self.db.executemany(
+            "INSERT OR IGNORE INTO outbox (source, source_msg_id, target, created) VALUES (?, ?, ?, ?)",
+            journal
+        )
+        self.db.executemany(
+            "INSERT OR REPLACE INTO message_map (source, source_msg_id, target, target_msg_id, created) "
+            "VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+        self.db.executemany(
+            "INSERT INTO source_cursor (source, last_msg_id) VALUES (?, ?) "
+            "ON CONFLICT (source) DO UPDATE SET last_msg_id = MAX(last_msg_id, excluded.last_msg_id)",
+            cursors
+        )
+        self.db.executemany(
+            "DELETE FROM outbox WHERE source = ? AND source_msg_id = ? AND target = ?",
+            acks
+        )
+        self.db.commit()
+
+    def _prune(self):
+        cutoff = self.db.execute(
+            "SELECT created FROM message_map ORDER BY created DESC LIMIT 1 OFFSET ?",
+            (self.max_rows,)
+        ).fetchone()
+        if cutoff:
+            self.db.execute("DELETE FROM message_map WHERE created <= ?", cutoff)
+            self.db.commit()
+
+    async def flush(self):
+        if self.db is None or not (self.pending or self.dirty_cursors or self.journal_pending or self.acks):
+            return
+        rows, self.pending = self.pending, []
+        cursors = [(source, self.cursors[source]) for source in self.dirty_cursors]
+        self.dirty_cursors = set()
+        journal, self.journal_pending = self.journal_pending, []
+        acks, self.acks = self.acks, []
+        try:
+            await self._run(self._write, rows, cursors, [entry for entry, _ in journal], acks)
+        except Exception as e:
+            logger.error(f"Failed to persist {len(rows)} message map entries and {len(journal)} outbox entries: {e}")
+            self.pending = rows + self.pending
+            self.dirty_cursors.update(source for source, _ in cursors)
+            self.journal_pending = journal + self.journal_pending
+            self.acks = acks + self.acks
+            # Don't hold sends back on a broken disk; the entries are retried with the next flush
+            for _, committed in journal:
+                if not committed.done():
+                    committed.set_result(False)
+            return
+        for _, committed in journal:
+            if not committed.done():
+                committed.set_result(True)
+        self.flushes += 1
+        if self.flushes % 100 == 0:
+            await self._run(self._prune)
+
+    async def _flusher(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.flush_event.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.flush_event.clear()
+            await self.flush()
+
+    async def close(self):
+        if self.flush_task:
+            self.flush_task.cancel()
+            try:
+                await self.flush_task
+            except asyncio.CancelledError:
+                pass
+            self.flush_task = None
+        await self.flush()
+        if self.db is not None:
+            await self._run(self.db.close)
+            self.db = None
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,82 @@
+"""
+Pre-resolved peers for every configured source and target.
+
+Sources and targets are configured as usernames or numeric IDs. They are
+resolved to InputPeer objects once at startup, so sends don't pay for entity
+resolution. The handler finds the configured source of an update through a
+plain dict lookup on the marked chat ID, without calling get_chat(). An entry
+is re-resolved only when Telegram reports it as invalid.
+"""
+
+import logging
+import time
+
+from telethon import utils
+from telethon.errors import ChannelInvalidError, PeerIdInvalidError
+
+logger = logging.getLogger(__name__)
+
+# Errors meaning the cached peer is stale and should be resolved again
+INVALID_PEER_ERRORS = (ValueError, PeerIdInvalidError, ChannelInvalidError)
+
+
+def lookup_key(name):
+    """Numeric strings are IDs; anything else is a username or link."""
+    stripped = name.lstrip("-")
+    return int(name) if stripped.isdigit() else name
+
+
+class PeerCache:
+    def __init__(self, client):
+        self.client = client
+        self.peers = {}
+        self.source_by_chat_id = {}
+
+    async def resolve(self, name, refresh=False):
+        if not refresh:
+            peer = self.peers.get(name)
+            if peer is not None:
+                return peer
+        key = lookup_key(name)
+        if refresh:
+            # get_entity() goes to Telegram instead of trusting the session cache
+            peer = utils.get_input_peer(await self.client.get_entity(key))
+        else:
+            peer = await self.client.get_input_entity(key)
+        self.peers[name] = peer
+        return peer
+
+    def add_source(self, name, chat_id):
+        self.source_by_chat_id[chat_id] = name
+
+    async def warm_up(self, sources, targets):
+        started = time.perf_counter()
+        for name in list(sources) + list(targets):
+            try:
+                peer = await self.resolve(name)
+            except Exception as e:
+                logger.error(f"Could not resolve {name}: {e}")
+                continue
+            if name in sources:
+                self.add_source(name, utils.get_peer_id(peer))
+        elapsed = (time.perf_counter() - started) * 1000
+        logger.info(f"Resolved {len(self.peers)} peers in {elapsed:.0f} ms")
+
+    def source_for_chat(self, chat_id):
+        return self.source_by_chat_id.get(chat_id)
+
+    def peer(self, name):
+        """The cached InputPeer, or the raw name if it hasn't been resolved."""
+        return self.peers.get(name, name)
+
+    async def call(self, name, fn):
+        """
+        Await fn(peer) with the cached peer for `name`, re-resolving it once
+        if Telegram says it is no longer valid.
+        """
+        try:
+            return await fn(self.peer(name))
+        except INVALID_PEER_ERRORS as e:
+            logger.warning(f"Peer {name} became invalid ({type(e).__name__}), resolving again")
+            peer = await self.resolve(name, refresh=True)
+            return await fn(peer)
@@ -0,0 +1,253 @@
+"""
+Routing table: which targets each source channel is forwarded to.
+
+A source can fan out to any number of targets and several sources can feed
+the same target. Every route carries its own referral link, suffix template
+and text rule pipeline; the suffix is rendered and the rules are compiled
+once when the table is built. Routes with identical rules share one compiled
+pipeline, so a message is transformed once per distinct rule set. A route may
+also set `max_age`: seconds after the source post beyond which a forward that
+is still queued is dropped rather than sent late (0 = no limit), and
+`coalesce`: seconds for which consecutive text posts are collected and sent
+to the target as one message (0 = off, see coalesce.py).
+
+Routes come from ROUTES_FILE (YAML) when it is set, otherwise from the
+SOURCE_CHANNELS / TARGET_CHANNELS / REFERRAL_LINKS environment lists.
+A table is immutable once built; reloading the file builds a new one that
+replaces the old table as a whole.
+"""
+
+import hashlib
+import os
+import re
+
+from text_transform import RulePipeline
+
+DEFAULT_SUFFIX_TEMPLATE = "Register: {referral}"
+
+RULE_KEYS = ("strip_urls", "strip_mentions", "ignore_case", "include", "exclude", "replace")
+
+
+class Route:
+    __slots__ = ("source", "target", "referral", "template", "suffix", "pipeline", "max_age", "coalesce")
+
+    def __init__(self, source, target, referral, template=DEFAULT_SUFFIX_TEMPLATE, pipeline=None, max_age=0,
+                 coalesce=0):
+        self.source = source
+        self.target = target
+        self.referral = referral
+        self.template = template
+        try:
+            self.suffix = template.format(referral=referral)
+        except (KeyError, IndexError, ValueError) as e:
+            # Only {referral} is filled in; literal braces must be doubled ({{ }})
+            raise ValueError(f"Suffix template {template!r} of {source} -> {target} is invalid: {e!r}")
+        self.pipeline = pipeline or _pipeline_for({})
+        self.max_age = max_age
+        self.coalesce = coalesce
+
+    def deadline(self, message_date):
+        """time.time() after which a message posted at `message_date` is stale, or None."""
+        if not self.max_age or message_date is None:
+            return None
+        return message_date.timestamp() + self.max_age
+
+    def __repr__(self):
+        return f"Route({self.source} -> {self.target})"
+
+
+class RoutingTable:
+    def __init__(self, routes, other_sources=()):
+        self.routes = list(routes)
+        self.by_source = {}
+        for route in self.routes:
+            self.by_source.setdefault(route.source, []).append(route)
+        # Sources of the full table that another shard forwards
+        self.other_sources = frozenset(other_sources)
+
+    @property
+    def sources(self):
+        return list(self.by_source)
+
+    @property
+    def targets(self):
+        return list(dict.fromkeys(route.target for route in self.routes))
+
+    def get(self, source):
+        return self.by_source.get(source, ())
+
+    def __len__(self):
+        return len(self.routes)
+
+    def shard(self, index, count):
+        """
+        The routes that fall into shard `index` of `count`. Routes linked by a
+        common source or target stay in one shard, so every update is handled
+        by exactly one process and every target is paced by a single one.
+        """
+        if count <= 1:
+            return self
+        shard_by_source = self.shard_by_source(count)
+        mine = [route for route in self.routes if shard_by_source[route.source] == index]
+        other_sources = {source for source, shard in shard_by_source.items() if shard != index}
+        return RoutingTable(mine, other_sources)
+
+    def shard_by_source(self, count):
+        """Source -> index of the shard (of `count`) that forwards it."""
+        group_of = self._groups()
+        return {source: shard_of(group_of[source], count) for source in self.by_source}
+
+    def _groups(self):
+        """Source -> name of the first source of its group of connected routes."""
+        parent = {}
+
+        def find(node):
+            while parent.setdefault(node, node) != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        for route in self.routes:
+            a, b = find(("source", route.source)), find(("target", route.target))
+            if a != b:
+                # Keep the smallest source as the root so the name is stable
+                parent[max(a, b)] = min(a, b)
+        return {source: find(("source", source))[1] for source in self.by_source}
+
+
+def shard_of(source, count):
+    # Stable across processes, unlike hash()
+    return int.from_bytes(hashlib.md5(source.encode()).digest()[:4], "big") % count
+
+
+_pipelines = {}
+
+
+def _pipeline_for(rules):
+    """Compile (or reuse) the RulePipeline for a dict of rule settings."""
+    replace = rules.get("replace") or []
+    key = (
+        bool(rules.get("strip_urls", True)),
+        bool(rules.get("strip_mentions", False)),
+        bool(rules.get("ignore_case", True)),
+        tuple(rules.get("include") or ()),
+        tuple(rules.get("exclude") or ()),
+        tuple((r["pattern"], r.get("with", "")) for r in replace),
+    )
+    pipeline = _pipelines.get(key)
+    if pipeline is None:
+        strip_urls, strip_mentions, ignore_case, include, exclude, replacements = key
+        pipeline = _pipelines[key] = RulePipeline(
+            strip_urls=strip_urls,
+            strip_mentions=strip_mentions,
+            replacements=replacements,
+            include=include,
+            exclude=exclude,
+            ignore_case=ignore_case,
+        )
+    return pipeline
+
+
+def load_routes_from_file(path):
+    """
+    Build the table from a YAML file:
+
+        defaults:              # optional, applies to every route
+          suffix: "Register: {referral}"
+          strip_mentions: true
+        routes:
+          - source: some_channel
+            target: my_channel
+            referral: https://example.com/?ref=1
+            max_age: 30
+            coalesce: 3
+            exclude: [loss]
+            replace:
+              - {pattern: "vip", with: "premium"}
+    """
+    import yaml
+
+    try:
+        with open(path, encoding="utf-8") as f:
+            config = yaml.safe_load(f) or {}
+    except (OSError, yaml.YAMLError) as e:
+        raise ValueError(f"Could not read {path}: {e}")
+
+    defaults = config.get("defaults") or {}
+    routes = []
+    for i, entry in enumerate(config.get("routes") or []):
+        settings = dict(defaults, **entry)
+        try:
+            source, target, referral = str(settings["source"]), str(settings["target"]), str(settings["referral"])
+        except KeyError as e:
+            raise ValueError(f"Route #{i + 1} in {path} is missing {e.args[0]!r}")
+        rules = {k: settings[k] for k in RULE_KEYS if k in settings}
+        try:
+            pipeline = _pipeline_for(rules)
+        except (re.error, KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Route #{i + 1} in {path} has an invalid rule: {e}")
+        # A bad ROUTE_MAX_AGE / ROUTE_COALESCE raises its own ValueError here
+        max_age = settings.get("max_age", _default_seconds("ROUTE_MAX_AGE"))
+        coalesce = settings.get("coalesce", _default_seconds("ROUTE_COALESCE"))
+        try:
+            max_age = float(max_age)
+        except (TypeError, ValueError):
+            raise ValueError(f"Route #{i + 1} in {path} has an invalid max_age: {max_age!r}")
+        try:
+            coalesce = float(coalesce)
+        except (TypeError, ValueError):
+            raise ValueError(f"Route #{i + 1} in {path} has an invalid coalesce: {coalesce!r}")
+        routes.append(Route(
+            source, target, referral, settings.get("suffix", DEFAULT_SUFFIX_TEMPLATE), pipeline, max_age, coalesce
+        ))
+    return RoutingTable(routes)
+
+
+def load_routes():
+    path = os.getenv("ROUTES_FILE")
+    if path:
+        return load_routes_from_file(path)
+    return load_routes_from_env()
+
+
+def _default_seconds(name):
+    try:
+        return float(os.getenv(name, "0"))
+    except ValueError:
+        raise ValueError(f"{name} must be a number of seconds.")
+
+
+def _split(name, sep=","):
+    return [v.strip() for v in os.getenv(name, "").split(sep) if v.strip()]
+
+
+def load_routes_from_env():
+    """
+    Build the table from SOURCE_CHANNELS / TARGET_CHANNELS / REFERRAL_LINKS.
+    The lists are read pairwise, so repeating a source fans it out to several
+    targets. SUFFIX_TEMPLATE sets the default suffix, and SUFFIX_TEMPLATES
+    (separated by ';') can override it per route. STRIP_MENTIONS=1 also
+    removes @mentions on every route, and ROUTE_MAX_AGE / ROUTE_COALESCE set
+    every route's max_age / coalesce.
+    """
+    sources = _split("SOURCE_CHANNELS")
+    targets = _split("TARGET_CHANNELS")
+    referrals = _split("REFERRAL_LINKS")
+    default_template = os.getenv("SUFFIX_TEMPLATE", DEFAULT_SUFFIX_TEMPLATE)
+    templates = _split("SUFFIX_TEMPLATES", ";")
+
+    if not (len(sources) == len(targets) == len(referrals)):
+        raise ValueError("SOURCE_CHANNELS, TARGET_CHANNELS and REFERRAL_LINKS counts must be equal.")
+    if templates and len(templates) != len(sources):
+        raise ValueError("SUFFIX_TEMPLATES must have one entry per route when set.")
+
+    pipeline = _pipeline_for({"strip_mentions": os.getenv("STRIP_MENTIONS", "0") == "1"})
+    max_age = _default_seconds("ROUTE_MAX_AGE")
+    coalesce = _default_seconds("ROUTE_COALESCE")
+    routes = [
+        Route(
+            source, target, referral, templates[i] if templates else default_template, pipeline, max_age, coalesce
+        )
+        for i, (source, target, referral) in enumerate(zip(sources, targets, referrals))
+    ]
+    return RoutingTable(routes)
@@ -1,9 +1,24 @@
-import subprocess
-import time
+"""
+Supervisor for the forwarder.
+
+Splits the channel routes into SHARDS worker processes (each one runs
+telegram_forwarder.py with its own event loop and a share of the sources)
+and restarts a crashed shard with exponential backoff while the others keep
+forwarding. Crash notifications to the admin are sent in the background so
+they never delay a restart.
+"""
+
+import asyncio
 import os
-from dotenv import load_dotenv
+import sys
+import time
 import traceback
+from collections import deque
+
 import requests
+from dotenv import load_dotenv
+
+from routing import load_routes
 
 load_dotenv()
 
@@ -11,6 +26,14 @@ BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 ADMIN_CHAT_ID = os.getenv("ADMIN_CHAT_ID")  # Use numeric ID (like "123456789") or your @username
 LOG_FILE = "crash.log"
 
+SHARDS = max(1, int(os.getenv("SHARDS", "1")))
+RESTART_BACKOFF_MIN = float(os.getenv("RESTART_BACKOFF_MIN", "1"))
+RESTART_BACKOFF_MAX = float(os.getenv("RESTART_BACKOFF_MAX", "300"))
+# A shard that stayed up this long (seconds) restarts with the minimum backoff again
+STABLE_AFTER = float(os.getenv("STABLE_AFTER", "60"))
+NOTIFY_TIMEOUT = float(os.getenv("NOTIFY_TIMEOUT", "10"))
+STDERR_TAIL_LINES = 200
+
 def send_telegram_message(text):
     if not BOT_TOKEN or not ADMIN_CHAT_ID:
         return
@@ -18,6 +41,7 @@ def send_telegram_message(text):
         requests.post(
             f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage",
             data={"chat_id": ADMIN_CHAT_ID, "text": text[:4096]},
+            timeout=NOTIFY_TIMEOUT,
         )
     except Exception as e:
         print(f"Failed to send Telegram message: {e}")
@@ -31,28 +55,113 @@ def send_telegram_document(file_path):
                 f"https://api.telegram.org/bot{BOT_TOKEN}/sendDocument",
                 data={"chat_id": ADMIN_CHAT_ID},
                 files={"document": f},
+                timeout=NOTIFY_TIMEOUT,
             )
     except Exception as e:
         print(f"Failed to send crash log: {e}")
 
-while True:
+def notify_crash(text, log_file):
+    send_telegram_message(text)
+    send_telegram_document(log_file)
+
+class Shard:
+    def __init__(self, index, count, port, running):
+        self.index = index
+        self.count = count
+        self.port = port
+        self.running = running
+        self.name = f"shard {index}/{count}"
+        self.log_file = LOG_FILE if count == 1 else f"crash_shard{index}.log"
+        self.stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+        self.backoff = RESTART_BACKOFF_MIN
+        self.process = None
+
+    def env(self):
+        env = dict(os.environ)
+        env["SHARD_INDEX"] = str(self.index)
+        env["SHARD_COUNT"] = str(self.count)
+        # The account budget is split between the shards that actually run
+        env["RUNNING_SHARDS"] = ",".join(str(i) for i in self.running)
+        # Each shard serves /health, /ready, /stats and /metrics on its own port
+        env["PORT"] = str(self.port)
+        return env
+
+    async def _pump_stderr(self):
+        # Pass the child's stderr (its log output) through and keep the tail for crash reports
+        async for line in self.process.stderr:
+            text = line.decode(errors="replace")
+            self.stderr_tail.append(text)
+            sys.stderr.write(text)
+
+    async def run_once(self):
+        self.stderr_tail.clear()
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, "telegram_forwarder.py",
+            env=self.env(),
+            stderr=asyncio.subprocess.PIPE,
+        )
+        await asyncio.gather(self._pump_stderr(), self.process.wait())
+        return self.process.returncode
+
+    def report_crash(self, returncode):
+        with open(self.log_file, "w") as f:
+            f.write(f"{self.name} exited with code {returncode}\n\n")
+            f.writelines(self.stderr_tail)
+        tail = "".join(list(self.stderr_tail)[-20:])
+        text = f"🚨 Bot crashed ({self.name}, exit code {returncode})!\n\n{tail}"
+        # Fire and forget: the restart must not wait on the Bot API
+        asyncio.get_running_loop().run_in_executor(None, notify_crash, text, self.log_file)
+
+    async def supervise(self):
+        while True:
+            print(f"🚀 Starting bot ({self.name})...")
+            started = time.monotonic()
+            try:
+                returncode = await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                print(f"❌ Unexpected supervisor error in {self.name}:")
+                traceback.print_exc()
+                returncode = None
+
+            if time.monotonic() - started >= STABLE_AFTER:
+                self.backoff = RESTART_BACKOFF_MIN
+
+            if returncode == 0:
+                print(f"{self.name} exited cleanly.")
+            else:
+                print(f"💥 Bot crashed ({self.name}). Logging error and notifying admin.")
+                self.report_crash(returncode)
+
+            print(f"🔄 Restarting {self.name} in {self.backoff:.0f} seconds...")
+            await asyncio.sleep(self.backoff)
+            self.backoff = min(self.backoff * 2, RESTART_BACKOFF_MAX)
+
+    def terminate(self):
+        if self.process and self.process.returncode is None:
+            self.process.terminate()
+
+async def supervise():
+    routing_table = load_routes()
+    # A shard without any source to watch would only idle, so it isn't started;
+    # routes a later reload puts on such a shard are logged until a restart.
+    # Ports go to the shards that run, so the first of them always answers on PORT
+    indexes = [i for i in range(SHARDS) if len(routing_table.shard(i, SHARDS))]
+    base_port = int(os.environ.get("PORT", 10000))
+    shards = [Shard(i, SHARDS, base_port + n, indexes) for n, i in enumerate(indexes)]
+    print(f"Supervising {len(shards)} shard(s) for {len(routing_table)} route(s)")
     try:
-        print("🚀 Starting bot...")
-        subprocess.run(["python", "telegram_forwarder.py"], check=True)
-    except subprocess.CalledProcessError as e:
-        error_text = traceback.format_exc()
-        print("💥 Bot crashed. Logging error and notifying admin.")
-        with open(LOG_FILE, "w") as f:
-            f.write(str(e))
-        send_telegram_message("🚨 Bot crashed!\n\n" + str(e))
-        send_telegram_document(LOG_FILE)
-    except Exception as e:
-        print("❌ Unexpected crash:")
-        traceback.print_exc()
-        with open(LOG_FILE, "w") as f:
-            f.write(traceback.format_exc())
-        send_telegram_message("🚨 Bot crashed with unexpected error:\n\n" + traceback.format_exc())
-        send_telegram_document(LOG_FILE)
-
-    print("🔄 Restarting in 5 seconds...")
-    time.sleep(5)
+        await asyncio.gather(*(shard.supervise() for shard in shards))
+    finally:
+        for shard in shards:
+            shard.terminate()
+
+def main():
+    try:
+        asyncio.run(supervise())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
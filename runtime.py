@@ -0,0 +1,78 @@
+"""
+Event loop and startup helpers for the forwarder process.
+
+The fast runtime (FAST_RUNTIME=1) runs the forwarder on uvloop and refuses
+to start without cryptg for MTProto's AES. Without it Telethon falls back to
+OpenSSL through ctypes or, failing that, pure Python, which cost roughly 60x
+and 1000x more CPU per megabyte of media (see benchmarks/bench_runtime.py).
+Install the extras with `pip install -r requirements-fast.txt`.
+
+StartupTimer records how long each startup phase took so the breakdown can
+be logged once the forwarder is live.
+"""
+
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self.last = self.started
+        self.phases = []
+
+    def mark(self, phase):
+        """Close the phase that ran since the previous mark."""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    @property
+    def total(self):
+        return self.last - self.started
+
+    def summary(self):
+        parts = ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in self.phases)
+        return f"{parts}; total {self.total:.2f}s"
+
+
+def native_crypto():
+    """Name of the AES backend Telethon will use: "cryptg", "libssl" or None (pure Python)."""
+    from telethon.crypto import aes, libssl
+
+    if aes.cryptg is not None:
+        return "cryptg"
+    if libssl.encrypt_ige and libssl.decrypt_ige:
+        return "libssl"
+    return None
+
+
+def fast_runtime_problem():
+    """Why the fast runtime can't be used here, or None if it can."""
+    try:
+        import uvloop  # noqa: F401
+    except ImportError:
+        return "FAST_RUNTIME=1 needs uvloop (pip install -r requirements-fast.txt)"
+    if native_crypto() != "cryptg":
+        return "FAST_RUNTIME=1 needs cryptg for AES (pip install -r requirements-fast.txt)"
+    return None
+
+
+def run(main, fast=False):
+    """
+    Run the `main` coroutine function to completion, on uvloop in fast mode.
+    Check fast_runtime_problem() before asking for fast mode.
+    """
+    if not fast:
+        return asyncio.run(main())
+
+    import uvloop
+
+    logger.info(f"🚀 Fast runtime: uvloop {uvloop.__version__}, {native_crypto()} AES")
+    if hasattr(uvloop, "run"):
+        return uvloop.run(main())
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return asyncio.run(main())
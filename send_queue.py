@@ -0,0 +1,317 @@
+"""
+Outbound send queues for the forwarder.
+
+Every target channel gets its own asyncio queue and worker task so a slow or
+flood-limited target never holds up the others. Each send has to take a token
+from the target's bucket (per-chat limit) and from the bucket of the account
+that sends to the target (account-wide limit) before it goes out. A
+FloodWaitError pauses only the affected target and the same job is retried
+once the wait is over.
+
+Each target has one queue per lane. Text goes through the "text" lane, which
+is urgent: while a text send is waiting for a token, the other lanes don't get
+one. Every lane also has its own concurrency limit over all targets, so a
+burst of uploads can't occupy every connection; only the API call itself
+holds a slot, not the wait for tokens or a flood wait.
+
+Jobs may carry a deadline (wall-clock time after which the content is no
+longer worth sending). Each queue hands out the job with the earliest
+deadline first, and a job found past its deadline, whether still queued
+or after a flood wait, is dropped as "stale" instead of sent.
+"""
+
+import asyncio
+import itertools
+import logging
+import math
+import time
+
+from telethon.errors import ChannelPrivateError, ChatAdminRequiredError, FloodWaitError
+
+from metrics import DROPPED, FLOOD_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, holding at most `capacity`.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.urgent_waiting = 0
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def pause(self, seconds):
+        """Stop handing out tokens for `seconds` (used for flood waits)."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    async def acquire(self, urgent=False):
+        """
+        Take one token. Non-urgent callers give way while an urgent caller
+        is waiting for a token.
+        """
+        if urgent:
+            self.urgent_waiting += 1
+        try:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1 and (urgent or not self.urgent_waiting):
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep(max(1 - self.tokens, 0.1) / self.rate)
+        finally:
+            if urgent:
+                self.urgent_waiting -= 1
+
+
+class SendJob:
+    """
+    One outbound send. `send` is an async callable performing the actual API
+    call; it is invoked again if the first attempt hits a flood wait, so it must
+    build its arguments (e.g. the reply target) when called, not up front.
+    `on_sent` receives the sent message. `after`, if given, is awaited before
+    the job takes any tokens (it holds up the queue, so it must be quick), and
+    `on_done` is called once the job has finished, whether it was sent or not.
+    `deadline` is a time.time() value after which the job is dropped.
+    `park`, if given, is awaited outside the queue (e.g. to wait for the
+    message it replies to); the job is queued again once it returns, so the
+    jobs behind it keep going meanwhile.
+    """
+
+    __slots__ = ("send", "on_sent", "description", "after", "on_done", "deadline", "park")
+
+    def __init__(self, send, on_sent=None, description="", after=None, on_done=None, deadline=None, park=None):
+        self.send = send
+        self.on_sent = on_sent
+        self.description = description
+        self.after = after
+        self.on_done = on_done
+        self.deadline = deadline
+        self.park = park
+
+    def is_stale(self):
+        return self.deadline is not None and time.time() > self.deadline
+
+
+class TargetQueue:
+    def __init__(self, target, bucket, account_bucket, max_retries, limit=None, urgent=False):
+        self.target = target
+        # (deadline, sequence, job): earliest deadline first, FIFO among equals
+        self.queue = asyncio.PriorityQueue()
+        self.sequence = itertools.count()
+        self.bucket = bucket
+        # Looked up per send: the account that sends to the target can change on failover
+        self.account_bucket = account_bucket
+        self.max_retries = max_retries
+        self.limit = limit
+        self.urgent = urgent
+        self.parked = set()
+        self.task = asyncio.get_running_loop().create_task(self._worker())
+
+    def put(self, job):
+        deadline = math.inf if job.deadline is None else job.deadline
+        self.queue.put_nowait((deadline, next(self.sequence), job))
+
+    def _shed(self, job):
+        late = time.time() - job.deadline
+        logger.warning(f"⌛ Dropped {job.description} to {self.target}: {late:.1f}s past its deadline")
+        DROPPED.inc("stale")
+
+    async def _unpark(self, job):
+        try:
+            await job.park()
+        except Exception as e:
+            logger.error(f"Error while holding {job.description} for {self.target}: {e}", exc_info=True)
+        job.park = None
+        self.put(job)
+
+    def _park(self, job):
+        task = asyncio.get_running_loop().create_task(self._unpark(job))
+        self.parked.add(task)
+        task.add_done_callback(self.parked.discard)
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self.queue.get()
+            finished = True
+            try:
+                if job.is_stale():
+                    self._shed(job)
+                    continue
+                if job.park is not None:
+                    self._park(job)
+                    finished = False
+                    continue
+                if job.after is not None:
+                    await job.after()
+                await self._run(job)
+            except Exception as e:
+                logger.error(f"Error while preparing {job.description} for {self.target}: {e}", exc_info=True)
+                DROPPED.inc("send_error")
+            finally:
+                if finished and job.on_done is not None:
+                    job.on_done()
+                self.queue.task_done()
+
+    async def _send(self, job):
+        # Only the API call counts against the lane limit; token and flood
+        # waits of one target must not hold a slot other targets could use
+        if self.limit is None:
+            return await job.send()
+        async with self.limit:
+            return await job.send()
+
+    async def _run(self, job):
+        attempt = 0
+        while True:
+            await self.bucket.acquire(self.urgent)
+            await self.account_bucket(self.target).acquire(self.urgent)
+            # Waiting for tokens (or a flood wait) may have taken too long
+            if job.is_stale():
+                self._shed(job)
+                return
+            try:
+                sent_msg = await self._send(job)
+            except FloodWaitError as e:
+                FLOOD_WAIT_SECONDS.inc(self.target, amount=e.seconds)
+                attempt += 1
+                if attempt > self.max_retries:
+                    logger.error(f"Giving up on {job.description} to {self.target} after {attempt} flood waits.")
+                    DROPPED.inc("flood_retries_exhausted")
+                    return
+                logger.warning(f"Flood wait for {e.seconds} seconds on {self.target}, pausing this target only.")
+                self.bucket.pause(e.seconds)
+                continue
+            except ConnectionError as e:
+                # The watchdog is reconnecting the account; try again shortly
+                attempt += 1
+                if attempt > self.max_retries:
+                    logger.error(f"Giving up on {job.description} to {self.target}: {e}")
+                    DROPPED.inc("disconnected")
+                    return
+                await asyncio.sleep(attempt)
+                continue
+            except ChannelPrivateError:
+                logger.error(f"Cannot access target channel {self.target}. Check membership and permissions.")
+                DROPPED.inc("channel_private")
+                return
+            except ChatAdminRequiredError:
+                logger.error(f"User needs admin rights in the target channel {self.target}.")
+                DROPPED.inc("admin_required")
+                return
+            except Exception as e:
+                logger.error(f"Error while sending {job.description} to {self.target}: {e}", exc_info=True)
+                DROPPED.inc("send_error")
+                return
+
+            if sent_msg and job.on_sent:
+                job.on_sent(sent_msg)
+            return
+
+    async def close(self):
+        for task in list(self.parked):
+            task.cancel()
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+
+class SendDispatcher:
+    """
+    Owns one TargetQueue per (target, lane), created lazily on first use.
+
+    Lanes let slow work (e.g. media uploads) run in the background without
+    holding up the text of the same target. All lanes of a target share its
+    token bucket, so the per-chat limit still holds; lanes in `urgent_lanes`
+    are served first. `lane_limits` caps how many jobs of a lane are in
+    flight at once over all targets; lanes without an entry are unlimited.
+    `account_for(target)` names the account a send to `target` goes out on;
+    every account gets its own bucket of `global_rate` / `global_burst`.
+    """
+
+    def __init__(self, target_rate, target_burst, global_rate, global_burst, max_retries=5,
+                 lane_limits=None, urgent_lanes=("text",), account_for=None):
+        self.target_rate = target_rate
+        self.target_burst = target_burst
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.max_retries = max_retries
+        self.account_for = account_for
+        self.account_buckets = {}
+        self.lane_limits = {
+            lane: asyncio.Semaphore(limit) for lane, limit in (lane_limits or {}).items() if limit > 0
+        }
+        self.urgent_lanes = frozenset(urgent_lanes)
+        self.buckets = {}
+        self.queues = {}
+
+    def account_bucket(self, target):
+        account = self.account_for(target) if self.account_for is not None else None
+        bucket = self.account_buckets.get(account)
+        if bucket is None:
+            bucket = self.account_buckets[account] = TokenBucket(self.global_rate, self.global_burst)
+        return bucket
+
+    def _queue_for(self, target, lane):
+        queue = self.queues.get((target, lane))
+        if queue is None:
+            bucket = self.buckets.get(target)
+            if bucket is None:
+                bucket = self.buckets[target] = TokenBucket(self.target_rate, self.target_burst)
+            queue = TargetQueue(
+                target, bucket, self.account_bucket, self.max_retries,
+                self.lane_limits.get(lane), lane in self.urgent_lanes
+            )
+            self.queues[(target, lane)] = queue
+        return queue
+
+    def submit(self, target, job, lane="text"):
+        self._queue_for(target, lane).put(job)
+
+    def depth(self, target):
+        return sum(
+            queue.queue.qsize()
+            for (queue_target, _), queue in self.queues.items()
+            if queue_target == target
+        )
+
+    def depths(self):
+        """Queued jobs per target, over all lanes."""
+        totals = {}
+        for (target, _), queue in self.queues.items():
+            totals[target] = totals.get(target, 0) + queue.queue.qsize()
+        return totals
+
+    async def drain(self, timeout):
+        """Wait up to `timeout` seconds for every queued job to finish."""
+        joins = [queue.queue.join() for queue in self.queues.values()]
+        if not joins:
+            return True
+        try:
+            await asyncio.wait_for(asyncio.gather(*joins), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def close(self):
+        for queue in self.queues.values():
+            await queue.close()
+        self.queues.clear()
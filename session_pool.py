@@ -0,0 +1,105 @@
+"""
+Pool of Telegram accounts used for sending.
+
+Flood limits are per account, so spreading target channels over several
+accounts (string sessions made with String_session_generation.py) multiplies
+the available send rate. Targets are assigned to accounts by consistent
+hashing, so adding or removing an account only moves a few targets. When the
+owning account is in a long flood wait, its targets fail over to the next
+account on the ring until the wait is over.
+
+The first account is also the listener: it receives the source updates.
+"""
+
+import hashlib
+import logging
+import time
+from bisect import bisect_right
+
+from telethon.errors import FloodWaitError
+
+from metrics import FLOOD_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class Account:
+    def __init__(self, index, client, peers, media):
+        self.index = index
+        self.name = f"account{index}"
+        self.client = client
+        self.peers = peers
+        self.media = media
+        self.flooded_until = 0.0
+
+    def available(self, now=None):
+        return (now or time.monotonic()) >= self.flooded_until
+
+    def __repr__(self):
+        return self.name
+
+
+class SessionPool:
+    def __init__(self, accounts, failover_after=30, vnodes=64):
+        self.accounts = list(accounts)
+        self.failover_after = failover_after
+        self.ring = sorted(
+            (_hash(f"{account.name}#{i}"), account.index)
+            for account in self.accounts
+            for i in range(vnodes)
+        )
+        self.ring_keys = [h for h, _ in self.ring]
+
+    @property
+    def listener(self):
+        return self.accounts[0]
+
+    def _candidates(self, target):
+        """Accounts in ring order starting at the owner of `target`."""
+        start = bisect_right(self.ring_keys, _hash(str(target))) % len(self.ring)
+        seen = set()
+        for i in range(len(self.ring)):
+            index = self.ring[(start + i) % len(self.ring)][1]
+            if index not in seen:
+                seen.add(index)
+                yield self.accounts[index]
+                if len(seen) == len(self.accounts):
+                    return
+
+    def owner(self, target):
+        return next(self._candidates(target))
+
+    def account_for(self, target):
+        """The first account on the ring for `target` that isn't flood-waiting."""
+        now = time.monotonic()
+        for account in self._candidates(target):
+            if account.available(now):
+                return account
+        return None
+
+    async def call(self, target, fn):
+        """
+        Await fn(account) on the account responsible for `target`. A flood
+        wait of at least `failover_after` seconds marks the account as busy and
+        moves on to the next one; shorter waits, or running out of accounts,
+        re-raise the FloodWaitError for the send queue to handle.
+        """
+        while True:
+            account = self.account_for(target)
+            if account is None:
+                account = min(self.accounts, key=lambda a: a.flooded_until)
+            try:
+                return await fn(account)
+            except FloodWaitError as e:
+                if len(self.accounts) == 1 or e.seconds < self.failover_after:
+                    raise
+                account.flooded_until = time.monotonic() + e.seconds
+                logger.warning(f"{account} is flood-waiting {e.seconds}s, failing {target} over to another account")
+                if self.account_for(target) is None:
+                    raise
+                # Re-raised waits are counted by the send queue; this one never gets there
+                FLOOD_WAIT_SECONDS.inc(target, amount=e.seconds)
@@ -0,0 +1,166 @@
+"""
+Connection watchdog.
+
+A connection can go half-dead: the socket stays open, run_until_disconnected()
+keeps waiting and no updates arrive. Every `interval` seconds the watchdog
+sends an MTProto ping on each account and records the round trip. After
+`max_failures` pings in a row go unanswered within `ping_timeout`, the
+account is reconnected in-process, and the listener then fetches the updates
+it missed with catch_up(). The listener is also resynced when no update at
+all has arrived for `update_silence` seconds even though pings still work,
+which covers an update stream that died on a live connection.
+"""
+
+import asyncio
+import logging
+import random
+import time
+
+from telethon import events
+from telethon.tl.functions import PingRequest
+
+from metrics import RECONNECTS
+
+logger = logging.getLogger(__name__)
+
+
+class ClientHealth:
+    __slots__ = ("state", "rtt", "failures", "last_pong", "last_update", "reconnected")
+
+    def __init__(self):
+        now = time.monotonic()
+        self.state = "ok"
+        self.rtt = None
+        self.failures = 0
+        self.last_pong = now
+        self.last_update = now
+        self.reconnected = asyncio.Event()
+        self.reconnected.set()
+
+
+class Watchdog:
+    def __init__(self, accounts, interval=30, ping_timeout=10, max_failures=2, update_silence=300):
+        self.accounts = list(accounts)
+        self.listener = self.accounts[0]
+        self.interval = interval
+        self.ping_timeout = ping_timeout
+        self.max_failures = max_failures
+        self.update_silence = update_silence
+        self.health = {account.name: ClientHealth() for account in self.accounts}
+        self._tasks = []
+
+    async def _on_update(self, update):
+        self.health[self.listener.name].last_update = time.monotonic()
+
+    def healthy(self):
+        return all(
+            health.state == "ok" and account.client.is_connected()
+            for account, health in zip(self.accounts, self.health.values())
+        )
+
+    def status(self):
+        now = time.monotonic()
+        return {
+            account.name: {
+                "state": health.state,
+                "connected": account.client.is_connected(),
+                "ping_ms": None if health.rtt is None else round(health.rtt * 1000, 1),
+                "since_pong": round(now - health.last_pong),
+                "since_update": round(now - health.last_update) if account is self.listener else None,
+            }
+            for account, health in zip(self.accounts, self.health.values())
+        }
+
+    def reconnecting(self, account):
+        return self.health[account.name].state != "ok"
+
+    async def wait_reconnected(self, account):
+        await self.health[account.name].reconnected.wait()
+
+    async def _ping(self, account):
+        started = time.perf_counter()
+        await asyncio.wait_for(
+            account.client(PingRequest(ping_id=random.getrandbits(63))), timeout=self.ping_timeout
+        )
+        return time.perf_counter() - started
+
+    async def _reconnect(self, account, reason):
+        health = self.health[account.name]
+        health.state = "reconnecting"
+        health.reconnected.clear()
+        logger.warning(f"🔌 {account.name} looks stalled ({reason}), reconnecting")
+        delay = 1
+        while True:
+            try:
+                await account.client.disconnect()
+                await account.client.connect()
+                break
+            except Exception as e:
+                health.state = "down"
+                logger.error(f"Reconnecting {account.name} failed: {e}; retrying in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+        RECONNECTS.inc(account.name)
+        if account is self.listener:
+            await self._resync(account)
+        now = time.monotonic()
+        health.state = "ok"
+        health.failures = 0
+        health.last_pong = health.last_update = now
+        health.reconnected.set()
+        logger.info(f"🔌 {account.name} reconnected")
+
+    async def _resync(self, account):
+        try:
+            await account.client.catch_up()
+        except Exception as e:
+            logger.error(f"Fetching missed updates for {account.name} failed: {e}")
+
+    async def _check(self, account):
+        health = self.health[account.name]
+        if health.state != "ok":
+            return
+        if not account.client.is_connected():
+            await self._reconnect(account, "disconnected")
+            return
+        try:
+            health.rtt = await self._ping(account)
+            health.failures = 0
+            health.last_pong = time.monotonic()
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            health.failures += 1
+            logger.warning(f"Ping on {account.name} failed ({type(e).__name__}), {health.failures}/{self.max_failures}")
+            if health.failures >= self.max_failures:
+                await self._reconnect(account, f"{health.failures} pings unanswered")
+            return
+
+        silence = time.monotonic() - health.last_update
+        if account is self.listener and self.update_silence and silence > self.update_silence:
+            logger.info(f"No updates for {silence:.0f}s on {account.name}, fetching missed updates")
+            health.last_update = time.monotonic()
+            await self._resync(account)
+
+    async def _run(self, account):
+        # One loop per account: an account stuck reconnecting doesn't stop
+        # the others from being pinged and reconnected
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self._check(account)
+            except Exception as e:
+                logger.error(f"Watchdog check of {account.name} failed: {e}", exc_info=True)
+
+    def start(self):
+        self.listener.client.add_event_handler(self._on_update, events.Raw)
+        self._tasks = [asyncio.ensure_future(self._run(account)) for account in self.accounts]
+        logger.info(f"Watchdog pinging {len(self.accounts)} account(s) every {self.interval:g}s")
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
@@ -6,35 +6,35 @@ Preserves formatting, emojis, and entities while removing URLs and appending ref
 Now supports private target channels by using channel IDs (no '@' prefix).
 """
 
-from flask import Flask
-from threading import Thread
 import os
-import re
+import gc
+import time
+import itertools
 import logging
 import asyncio
+# Imported first so the startup breakdown covers everything below
+from runtime import StartupTimer, fast_runtime_problem, run as run_forwarder
+startup = StartupTimer()
 from telethon import TelegramClient, events
-from telethon.errors import ChannelPrivateError, ChatAdminRequiredError, FloodWaitError
 from dotenv import load_dotenv
 from telethon.sessions import StringSession
-from telethon.tl.types import (
-    MessageEntityTextUrl, MessageEntityUrl,
-    MessageEntityBold, MessageEntityItalic,
-    MessageEntityCode, MessageEntityPre
-)
-
-# Flask keep-alive server
-app = Flask('')
-
-@app.route('/')
-def home():
-    return "I'm alive"
-
-def run():
-    port = int(os.environ.get("PORT", 10000))
-    app.run(host="0.0.0.0", port=port)
-
-def keep_alive():
-    Thread(target=run).start()
+from telethon.errors import MessageAuthorRequiredError, MessageIdInvalidError, MessageNotModifiedError
+from telethon.tl.types import Message, UpdateNewChannelMessage
+from albums import MAX_ALBUM_PARTS, AlbumCollector
+from catchup import CatchUp
+from coalesce import Coalescer
+from dedup import DedupCache, fingerprint
+from deletes import DeleteBatcher
+from http_server import HttpServer
+from media_cache import MediaCache, MediaSender, is_sendable, media_key
+from metrics import REGISTRY, DROPPED, FORWARDED, FORWARD_LATENCY, PING_RTT, PROPAGATED, QUEUE_DEPTH, STAGE_SECONDS
+from msg_store import MessageIdStore
+from send_queue import SendDispatcher, SendJob
+from session_pool import Account, SessionPool
+from stall_watchdog import Watchdog
+from peer_cache import PeerCache, lookup_key
+from routing import load_routes, load_routes_from_file
+from text_transform import entities_to_markdown, append_suffix, join_texts
 
 # Load environment variables
 load_dotenv()
@@ -43,17 +43,125 @@ API_ID = int(os.getenv("TELEGRAM_API_ID", "28490021"))
 API_HASH = os.getenv("TELEGRAM_API_HASH", "e01e2bf792f3dc911ad7a8a760bfa613")
 STRING_SESSION = os.getenv("STRING_SESSION", None)
 
-SOURCE_CHANNELS = [c.strip() for c in os.getenv("SOURCE_CHANNELS", "").split(",") if c.strip()]
-TARGET_CHANNELS = [c.strip() for c in os.getenv("TARGET_CHANNELS", "").split(",") if c.strip()]
-REFERRAL_LINKS = [r.strip() for r in os.getenv("REFERRAL_LINKS", "").split(",") if r.strip()]
+# Extra accounts used for sending; targets are spread across all accounts
+STRING_SESSIONS = [c.strip() for c in os.getenv("STRING_SESSIONS", "").split(",") if c.strip()]
+# Flood waits at least this long (seconds) move a target to another account
+FAILOVER_AFTER = int(os.getenv("FAILOVER_AFTER", "30"))
+
+# Outbound rate limits: per target chat and per account
+TARGET_RATE = float(os.getenv("TARGET_RATE", "1"))
+TARGET_BURST = int(os.getenv("TARGET_BURST", "3"))
+GLOBAL_RATE = float(os.getenv("GLOBAL_RATE", "25"))
+GLOBAL_BURST = int(os.getenv("GLOBAL_BURST", "30"))
+FLOOD_MAX_RETRIES = int(os.getenv("FLOOD_MAX_RETRIES", "5"))
+
+# How formatting is sent: "entities" passes the adjusted entities straight to
+# Telegram, "markdown" renders them to Markdown and lets Telethon re-parse it
+FORMAT_MODE = os.getenv("FORMAT_MODE", "entities").lower()
+
+# Sends go through three lanes per target: "text" (always served first),
+# "media" and "bulk" (media above MEDIA_LARGE_MB). Each lane has its own limit
+# on sends in flight at once over all targets; 0 means unlimited
+MEDIA_LARGE_BYTES = int(os.getenv("MEDIA_LARGE_MB", "5")) * 1024 * 1024
+LANE_LIMITS = {
+    "text": int(os.getenv("TEXT_CONCURRENCY", "0")),
+    "media": int(os.getenv("MEDIA_CONCURRENCY", "4")),
+    "bulk": int(os.getenv("BULK_CONCURRENCY", "1")),
+}
+# Album parts (same grouped_id) are collected until none has arrived for
+# ALBUM_WINDOW seconds, then sent as one album; 0 forwards every part separately
+ALBUM_WINDOW = float(os.getenv("ALBUM_WINDOW", "0.5"))
+# A reply waits at most this long (seconds) for its parent, queued in another
+# lane, to be sent so it can be threaded under it
+REPLY_WAIT_TIMEOUT = float(os.getenv("REPLY_WAIT_TIMEOUT", "60"))
+MEDIA_CACHE_SIZE = int(os.getenv("MEDIA_CACHE_SIZE", "2000"))
+
+# Source -> target message ID mapping (for reply threading)
+MSG_MAP_DB = os.getenv("MSG_MAP_DB", "message_map.sqlite3")
+MSG_MAP_CACHE_SIZE = int(os.getenv("MSG_MAP_CACHE_SIZE", "50000"))
+MSG_MAP_MAX_ROWS = int(os.getenv("MSG_MAP_MAX_ROWS", "1000000"))
+
+# Catch-up after restart: messages older than CATCHUP_MAX_AGE seconds are not replayed
+CATCHUP_ENABLED = os.getenv("CATCHUP_ENABLED", "1") == "1"
+CATCHUP_MAX_AGE = int(os.getenv("CATCHUP_MAX_AGE", "300"))
+CATCHUP_RATE = float(os.getenv("CATCHUP_RATE", "5"))
+CATCHUP_LIMIT = int(os.getenv("CATCHUP_LIMIT", "500"))
+
+# Identical posts (after URL stripping) to the same target within DEDUP_WINDOW
+# seconds of a successful send are sent only once; 0 (the default) disables
+DEDUP_WINDOW = float(os.getenv("DEDUP_WINDOW", "0"))
+DEDUP_MAX_ENTRIES = int(os.getenv("DEDUP_MAX_ENTRIES", "100000"))
+
+# Journal every forward before sending it and replay unacknowledged ones after
+# a crash; replayed forwards already in the message map are not sent again
+OUTBOX_ENABLED = os.getenv("OUTBOX_ENABLED", "1") == "1"
+
+# Apply source edits and deletes to the forwarded copies (looked up in the
+# message map). Deletes are batched per target for DELETE_BATCH_WINDOW seconds
+PROPAGATE_EDITS = os.getenv("PROPAGATE_EDITS", "1") == "1"
+PROPAGATE_DELETES = os.getenv("PROPAGATE_DELETES", "1") == "1"
+DELETE_BATCH_WINDOW = float(os.getenv("DELETE_BATCH_WINDOW", "1"))
+
+# On shutdown, buffered albums, bursts and deletes are queued and the send
+# queues get this many seconds to drain; what is left is replayed from the outbox
+SHUTDOWN_GRACE = float(os.getenv("SHUTDOWN_GRACE", "5"))
+
+# Health, readiness, stats and metrics are served on PORT from the forwarder's event loop
+PORT = int(os.getenv("PORT", "10000"))
+
+# Every WATCHDOG_INTERVAL seconds each account is pinged; WATCHDOG_MAX_FAILURES
+# unanswered pings (WATCHDOG_PING_TIMEOUT each) reconnect it in-process, and
+# WATCHDOG_UPDATE_SILENCE seconds without any update resync the listener. 0 disables
+WATCHDOG_INTERVAL = float(os.getenv("WATCHDOG_INTERVAL", "30"))
+WATCHDOG_PING_TIMEOUT = float(os.getenv("WATCHDOG_PING_TIMEOUT", "10"))
+WATCHDOG_MAX_FAILURES = int(os.getenv("WATCHDOG_MAX_FAILURES", "2"))
+WATCHDOG_UPDATE_SILENCE = float(os.getenv("WATCHDOG_UPDATE_SILENCE", "300"))
+
+# With ROUTES_FILE set, the file is checked for changes every ROUTES_RELOAD_INTERVAL
+# seconds and applied without a restart (SIGHUP reloads immediately); 0 disables
+ROUTES_FILE = os.getenv("ROUTES_FILE")
+ROUTES_RELOAD_INTERVAL = float(os.getenv("ROUTES_RELOAD_INTERVAL", "5"))
+
+# RAW_UPDATES=1 takes posts of channel sources straight from UpdateNewChannelMessage,
+# skipping Telethon's NewMessage event objects; other sources still use NewMessage
+RAW_UPDATES = os.getenv("RAW_UPDATES", "0") == "1"
+# Write only every Nth per-message "received"/"forwarded" log line (1 = all)
+MESSAGE_LOG_EVERY = max(1, int(os.getenv("MESSAGE_LOG_EVERY", "1")))
+
+# Run on uvloop with native AES required (see runtime.py); startup timings are logged either way
+FAST_RUNTIME = os.getenv("FAST_RUNTIME", "0") == "1"
+
+# Set by runner.py when the routes are split over several processes
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", "0"))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))
+# Indexes of the shards runner.py started (shards without routes aren't)
+RUNNING_SHARDS = [int(i) for i in os.getenv("RUNNING_SHARDS", str(SHARD_INDEX)).split(",") if i.strip()]
 
 # Validation
 if not STRING_SESSION:
     print("ERROR: STRING_SESSION not set in .env")
     exit(1)
 
-if not (len(SOURCE_CHANNELS) == len(TARGET_CHANNELS) == len(REFERRAL_LINKS)):
-    print("ERROR: SOURCE_CHANNELS, TARGET_CHANNELS and REFERRAL_LINKS counts must be equal.")
+try:
+    all_routes = load_routes()
+except ValueError as e:
+    print(f"ERROR: {e}")
+    exit(1)
+
+if not len(all_routes):
+    print("ERROR: No routes configured (check SOURCE_CHANNELS / TARGET_CHANNELS / REFERRAL_LINKS).")
+    exit(1)
+
+# May be empty if a reload moved every route of this shard elsewhere; it then idles
+routing_table = all_routes.shard(SHARD_INDEX, SHARD_COUNT)
+
+if FORMAT_MODE not in ("entities", "markdown"):
+    print("ERROR: FORMAT_MODE must be 'entities' or 'markdown'.")
+    exit(1)
+
+fast_runtime_error = fast_runtime_problem() if FAST_RUNTIME else None
+if fast_runtime_error:
+    print(f"ERROR: {fast_runtime_error}")
     exit(1)
 
 logging.basicConfig(
@@ -62,190 +170,746 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-client = TelegramClient(StringSession(STRING_SESSION), API_ID, API_HASH)
+def make_account(index, session):
+    account_client = TelegramClient(StringSession(session), API_ID, API_HASH)
+    return Account(index, account_client, PeerCache(account_client), MediaSender(MediaCache(MEDIA_CACHE_SIZE)))
 
-URL_PATTERN = re.compile(r'https?://\S+')
+session_pool = SessionPool(
+    [make_account(i, session) for i, session in enumerate([STRING_SESSION] + STRING_SESSIONS)],
+    failover_after=FAILOVER_AFTER
+)
 
-channel_map = {
-    SOURCE_CHANNELS[i]: (TARGET_CHANNELS[i], REFERRAL_LINKS[i])
-    for i in range(len(SOURCE_CHANNELS))
-}
+# The first account listens to the sources
+client = session_pool.listener.client
+peer_cache = session_pool.listener.peers
 
-msg_id_map = {}
+msg_id_map = MessageIdStore(MSG_MAP_DB, cache_size=MSG_MAP_CACHE_SIZE, max_rows=MSG_MAP_MAX_ROWS)
 
-def remove_urls_and_adjust_entities(text, entities):
-    if not text:
-        return None, None
+dedup = DedupCache(DEDUP_WINDOW, DEDUP_MAX_ENTRIES)
 
-    url_spans = []
-    if entities:
-        for ent in entities:
-            if isinstance(ent, (MessageEntityTextUrl, MessageEntityUrl)):
-                url_spans.append((ent.offset, ent.offset + ent.length))
+# Created in main() once the event loop is running
+dispatcher = None
+catch_up = None
+config_watcher = None
+watchdog = None
 
-    covered_spans = set()
-    for start, end in url_spans:
-        covered_spans.update(range(start, end))
+# (source, source_msg_id, target) -> Event set once that forward has finished
+pending_forwards = {}
 
-    for match in URL_PATTERN.finditer(text):
-        start, end = match.span()
-        if not any(pos in covered_spans for pos in range(start, end)):
-            url_spans.append((start, end))
+# Channel ID (unmarked, as in PeerChannel) -> source name, for the raw update handler
+channel_sources = {}
 
-    url_spans = sorted(url_spans, key=lambda x: x[0], reverse=True)
+_log_counter = itertools.count()
 
-    cleaned_text = text
-    for start, end in url_spans:
-        cleaned_text = cleaned_text[:start] + cleaned_text[end:]
+def should_log():
+    """True for every MESSAGE_LOG_EVERY-th per-message log line."""
+    return MESSAGE_LOG_EVERY == 1 or next(_log_counter) % MESSAGE_LOG_EVERY == 0
 
-    adjusted_entities = []
-    for ent in entities or []:
-        if isinstance(ent, (MessageEntityTextUrl, MessageEntityUrl)):
-            continue
+def prepare_text(message, pipeline):
+    """
+    Run a route's text rules over the message. The result is shared by every
+    route of the message with the same rules; only the suffix differs per target.
+    """
+    # Entity offsets refer to the raw text, not the Markdown-rendered message.text
+    cleaned_text, adjusted_entities = pipeline.apply(message.message or "", message.entities)
+    if FORMAT_MODE == "markdown" and cleaned_text:
+        return entities_to_markdown(cleaned_text, adjusted_entities), None
+    return cleaned_text, adjusted_entities
 
-        removed_before = 0
-        for start, end in url_spans:
-            if start < ent.offset:
-                removed_before += (end - start)
+def render_outgoing(prepared, route):
+    """
+    Append the route's suffix and return (text, kwargs) for
+    send_message/send_file according to FORMAT_MODE.
+    """
+    cleaned_text, adjusted_entities = prepared
 
-        new_offset = ent.offset - removed_before
-        if new_offset < 0:
-            continue
+    if FORMAT_MODE == "markdown":
+        full_text = f"{cleaned_text}\n\n{route.suffix}" if cleaned_text else route.suffix
+        return full_text, {"parse_mode": "md"}
 
-        new_length = ent.length
-        if new_offset + new_length > len(cleaned_text):
-            new_length = len(cleaned_text) - new_offset
-            if new_length <= 0:
-                continue
+    full_text, entities = append_suffix(cleaned_text, adjusted_entities, route.suffix)
+    # send_file/albums treat an empty entity list as "none given" and parse
+    # the caption with the default parse mode, so turn parsing off explicitly
+    return full_text, {"formatting_entities": entities, "parse_mode": None}
+
+async def send_to_target(target, send):
+    """
+    Await send(account, peer) on the account that currently owns `target`,
+    with flood-wait failover between accounts and peer refresh on errors.
+    """
+    return await session_pool.call(
+        target,
+        lambda account: account.peers.call(target, lambda peer: send(account, peer))
+    )
+
+async def send_preserving_entities(route, prepared, reply_to_id=None):
+    full_text, format_kwargs = render_outgoing(prepared, route)
+
+    sent_msg = await send_to_target(route.target, lambda account, peer: account.client.send_message(
+        peer,
+        full_text,
+        reply_to=reply_to_id,
+        **format_kwargs
+    ))
+    return sent_msg
 
-        new_ent = type(ent)(
-            offset=new_offset,
-            length=new_length,
-            **{k: v for k, v in vars(ent).items() if k not in ('offset', 'length')}
+def submit_forward(message, source, route, prepared, replay=False, album=None, merged=None, digests=()):
+    """
+    Queue the forward of `message` to `route.target`. For an album, `album`
+    holds all its parts (`message` being the first) and they are sent
+    together; `merged` likewise holds coalesced text messages whose joined
+    text is `prepared`. Replayed messages (outbox or catch-up) are checked
+    against the message map at send time so nothing is posted twice.
+    `digests` are the dedup fingerprints held in flight for this send.
+    """
+    target = route.target
+    parts = album or merged or [message]
+    key = (source, message.id, target)
+    if replay and key in pending_forwards:
+        for digest in digests:
+            dedup.release(target, digest)
+        return
+    deadline = route.deadline(message.date)
+    reply_to_msg_id = next((part.reply_to_msg_id for part in parts if part.reply_to_msg_id), None)
+
+    async def lookup_reply_to():
+        # Resolved at send time: the parent may still be queued ahead of us
+        if reply_to_msg_id:
+            return await msg_id_map.get(source, reply_to_msg_id, target)
+        return None
+
+    done = asyncio.Event()
+    for part in parts:
+        pending_forwards[(source, part.id, target)] = done
+    journaled = [msg_id_map.journal(source, part.id, target) for part in parts] if OUTBOX_ENABLED else None
+
+    def finished():
+        done.set()
+        for digest in digests:
+            dedup.release(target, digest)
+        for part in parts:
+            part_key = (source, part.id, target)
+            if pending_forwards.get(part_key) is done:
+                del pending_forwards[part_key]
+            if journaled is not None:
+                msg_id_map.ack(source, part.id, target)
+
+    async def already_sent():
+        if replay and await msg_id_map.get(source, message.id, target) is not None:
+            logger.info(f"⏩ Message {message.id} from {source} was already sent to {target}")
+            DROPPED.inc("already_sent")
+            return True
+        return False
+
+    async def wait_for_parent():
+        # Text overtakes media, so a reply's parent may still be in another lane
+        parent = pending_forwards.get((source, reply_to_msg_id, target))
+        if parent is None or parent is done:
+            return
+        try:
+            await asyncio.wait_for(parent.wait(), REPLY_WAIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"Parent of message {message.id} from {source} is still pending, sending without reply")
+
+    async def before_send():
+        if journaled is not None:
+            await asyncio.gather(*journaled)
+
+    # A reply whose parent is still queued waits outside the lane, so the
+    # texts behind it aren't held up by the parent's upload
+    parent = pending_forwards.get((source, reply_to_msg_id, target)) if reply_to_msg_id else None
+    park = wait_for_parent if parent is not None and parent is not done else None
+
+    def record_sent(sent_msg, kind):
+        # Merged messages all map to the one message they were sent as
+        sent_msgs = sent_msg if isinstance(sent_msg, list) else [sent_msg] * len(parts)
+        for part, sent_part in zip(parts, sent_msgs):
+            msg_id_map.put(source, part.id, target, sent_part.id)
+        msg_id_map.advance_cursor(source, parts[-1].id)
+        for digest in digests:
+            dedup.sent(target, digest)
+        FORWARDED.inc(target, kind)
+        if message.date:
+            FORWARD_LATENCY.observe(time.time() - message.date.timestamp(), target, kind)
+
+    if album is not None:
+        caption_full, format_kwargs = render_outgoing(prepared, route)
+        size = sum((part.file.size or 0) for part in parts if part.file is not None)
+
+        async def send_album():
+            if await already_sent():
+                return None
+            reply_to_id = await lookup_reply_to()
+            started = time.perf_counter()
+            sent_msgs = await send_to_target(target, lambda account, peer: account.media.send_album(
+                account.client,
+                peer,
+                parts,
+                source_client=client,
+                caption=caption_full,
+                reply_to=reply_to_id,
+                **format_kwargs
+            ))
+            STAGE_SECONDS.observe(time.perf_counter() - started, "upload")
+            if should_log():
+                logger.info(f"✅ Forwarded album of {len(parts)} from {source} to {target}")
+            return sent_msgs
+
+        dispatcher.submit(
+            target,
+            SendJob(
+                send_album, lambda m: record_sent(m, "album"), f"album from {source}",
+                before_send, finished, deadline, park
+            ),
+            lane="bulk" if size > MEDIA_LARGE_BYTES else "media"
         )
-        adjusted_entities.append(new_ent)
 
-    cleaned_text = cleaned_text.strip()
-    return cleaned_text if cleaned_text else None, adjusted_entities if adjusted_entities else None
+    elif is_sendable(message.media):
+        caption_full, format_kwargs = render_outgoing(prepared, route)
+        large = message.file is not None and (message.file.size or 0) > MEDIA_LARGE_BYTES
+
+        async def send_media():
+            if await already_sent():
+                return None
+            reply_to_id = await lookup_reply_to()
+            started = time.perf_counter()
+            sent_msg = await send_to_target(target, lambda account, peer: account.media.send(
+                account.client,
+                peer,
+                message,
+                source_client=client,
+                caption=caption_full,
+                reply_to=reply_to_id,
+                **format_kwargs
+            ))
+            STAGE_SECONDS.observe(time.perf_counter() - started, "upload")
+            if should_log():
+                logger.info(f"✅ Forwarded media from {source} to {target}")
+            return sent_msg
+
+        dispatcher.submit(
+            target,
+            SendJob(
+                send_media, lambda m: record_sent(m, "media"), f"media from {source}",
+                before_send, finished, deadline, park
+            ),
+            lane="bulk" if large else "media"
+        )
 
-def entities_to_markdown(text, entities):
+    else:
+        async def send_text():
+            if await already_sent():
+                return None
+            reply_to_id = await lookup_reply_to()
+            started = time.perf_counter()
+            sent_msg = await send_preserving_entities(route, prepared, reply_to_id)
+            STAGE_SECONDS.observe(time.perf_counter() - started, "send")
+            if should_log():
+                if merged:
+                    logger.info(f"Forwarded {len(merged)} merged text messages from {source} to {target}")
+                else:
+                    logger.info(f"Forwarded text message from {source} to {target} preserving formatting")
+            return sent_msg
+
+        dispatcher.submit(
+            target,
+            SendJob(
+                send_text, lambda m: record_sent(m, "text"), f"text from {source}",
+                before_send, finished, deadline, park
+            ),
+            lane="text"
+        )
+
+async def resolve_source(event):
+    """
+    Map an update to its configured source name. Normally a dict lookup on
+    the chat ID; only chats missed at startup fall back to get_chat().
     """
-    Simple converter from Telegram entities to Markdown formatting.
+    source = peer_cache.source_for_chat(event.chat_id)
+    if source is None:
+        chat = await event.get_chat()
+        source = chat.username or str(chat.id)
+        if routing_table.get(source):
+            peer_cache.add_source(source, event.chat_id)
+    return source
+
+def journal_held(source, message, target):
+    """Journal a message held back for an album or burst; submit_forward() journals it again (a no-op)."""
+    if OUTBOX_ENABLED:
+        msg_id_map.journal(source, message.id, target)
+
+def release_held(source, parts, target):
+    """Acknowledge held album parts that won't be sent to `target` after all."""
+    if OUTBOX_ENABLED:
+        for part in parts:
+            msg_id_map.ack(source, part.id, target)
+
+def process_message(message, source, replay=False, targets=None, album=None):
     """
-    if not entities:
-        return text
-
-    entities = sorted(entities, key=lambda e: e.offset, reverse=True)
-
-    for ent in entities:
-        start = ent.offset
-        end = start + ent.length
-        substring = text[start:end]
-
-        if isinstance(ent, MessageEntityBold):
-            md = f"**{substring}**"
-        elif isinstance(ent, MessageEntityItalic):
-            md = f"*{substring}*"
-        elif isinstance(ent, MessageEntityCode):
-            md = f"`{substring}`"
-        elif isinstance(ent, MessageEntityPre):
-            md = f"```\n{substring}\n```"
-        elif isinstance(ent, MessageEntityTextUrl):
-            md = f"[{substring}]({ent.url})"
-        elif isinstance(ent, MessageEntityUrl):
-            md = f"[{substring}]({substring})"
-        else:
-            md = substring
-
-        text = text[:start] + md + text[end:]
-
-    return text
-
-async def send_preserving_entities(client, target, message, referral_link, reply_to_id=None):
-    text = message.text or message.message or ""
-    entities = message.entities
-
-    cleaned_text, adjusted_entities = remove_urls_and_adjust_entities(text, entities)
-
-    if cleaned_text:
-        cleaned_text = cleaned_text.rstrip()
-        md_text = entities_to_markdown(cleaned_text, adjusted_entities)
-        full_text = f"{md_text}\n\nRegister: {referral_link}"
+    Filter, transform and queue `message` for every route of `source`, or
+    only for the routes to `targets` when given (outbox replay). Album parts
+    are buffered and come back here together as `album`, with the caption
+    and suffix applied once. Texts for routes with `coalesce` are buffered
+    per target and sent merged by submit_burst(). Buffered messages are
+    journaled right away, so a crash meanwhile doesn't lose them.
+    """
+    held = album or ()
+    if album is None:
+        if should_log():
+            preview_text = (message.message or "")[:30]
+            logger.info(f"Message received from {source}: {preview_text}{'...' if len(message.message or '') > 30 else ''}")
+        if message.grouped_id and ALBUM_WINDOW > 0 and media_key(message.media) is not None:
+            for route in routing_table.get(source):
+                if targets is None or route.target in targets:
+                    journal_held(source, message, route.target)
+            albums.add(source, message, replay, targets)
+            return
+    elif len(album) == 1:
+        album = None
     else:
-        full_text = f"Register: {referral_link}"
+        # The caption is on whichever part has text, usually the first
+        captioned = next((part for part in album if part.message), message)
+
+    routes = routing_table.get(source)
+    if not routes:
+        logger.warning(f"No target mapping found for source {source}")
+        DROPPED.inc("no_route")
+        return
+
+    # Each target has its own queue, so these go out concurrently
+    prepared_by_pipeline = {}
+    for route in routes:
+        if targets is not None and route.target not in targets:
+            continue
+        pipeline = route.pipeline
+        if not pipeline.accepts(captioned.message if album else message.message):
+            logger.info(f"⏩ Filtered out message from {source} for {route.target}")
+            DROPPED.inc("filtered")
+            release_held(source, held, route.target)
+            continue
+
+        cached = prepared_by_pipeline.get(id(pipeline))
+        if cached is None:
+            started = time.perf_counter()
+            prepared = prepare_text(captioned if album else message, pipeline)
+            STAGE_SECONDS.observe(time.perf_counter() - started, "transform")
+            media_id = tuple(media_key(part.media) for part in album) if album else media_key(message.media)
+            if media_id is None and is_sendable(message.media):
+                # A poll or location with the same (empty) caption isn't a duplicate
+                media_id = ("message", message.id)
+            digest = fingerprint(prepared[0], media_id)
+            cached = prepared_by_pipeline[id(pipeline)] = (prepared, digest)
+        prepared, digest = cached
+
+        if dedup.seen(route.target, digest):
+            logger.info(f"⏩ Skipped duplicate from {source} to {route.target}")
+            DROPPED.inc("duplicate")
+            release_held(source, held, route.target)
+            continue
+        if route.coalesce:
+            # Live standalone texts are merged; anything else first sends what was collected
+            if not replay and album is None and not message.reply_to_msg_id and not is_sendable(message.media):
+                journal_held(source, message, route.target)
+                bursts.add(route, source, message, prepared)
+                continue
+            bursts.flush(source, route.target)
+        submit_forward(message, source, route, prepared, replay, album, digests=(digest,))
+
+albums = AlbumCollector(
+    ALBUM_WINDOW,
+    lambda parts, source, replay, targets: process_message(parts[0], source, replay, targets, album=parts)
+)
+
+def submit_burst(route, source, messages, prepared):
+    # Buffered texts have no media, so their fingerprints are text-only
+    digests = [fingerprint(text, None) for text, _ in prepared]
+    if len(messages) == 1:
+        submit_forward(messages[0], source, route, prepared[0], digests=digests)
+    else:
+        submit_forward(messages[0], source, route, join_texts(prepared), merged=messages, digests=digests)
+
+bursts = Coalescer(submit_burst)
+
+async def handler(event):
+    message = event.message
+    started = time.perf_counter()
+    source = await resolve_source(event)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Resolved source {source} in {(time.perf_counter() - started) * 1e6:.0f} µs")
+
+    # Live updates wait (queued by Telethon) until the gap has been replayed
+    await catch_up.done.wait()
+    if catch_up.is_replayed(source, message.id):
+        return
+    process_message(message, source)
+
+async def raw_handler(update):
+    """
+    Fast path for channel sources: the bare Message of the update goes
+    straight into the pipeline, with the source found by channel ID.
+    """
+    message = update.message
+    source = channel_sources.get(getattr(message.peer_id, "channel_id", None))
+    # Service messages (pins, joins, ...) aren't posts; NewMessage skips them too
+    if source is None or type(message) is not Message:
+        return
+    if not catch_up.done.is_set():
+        await catch_up.done.wait()
+    if catch_up.is_replayed(source, message.id):
+        return
+    process_message(message, source)
+
+# (source, source_msg_id) -> edit_date of the last edit propagated, oldest first
+_edit_dates = {}
+_EDIT_DATES_MAX = 10000
 
-    sent_msg = await client.send_message(
+def submit_edit(message, source, route, prepared, copy_of):
+    """
+    Queue an edit of the copy of source message `copy_of` (normally
+    `message` itself) in `route.target` to the new text or caption of
+    `message`. Waits, outside the lane, for the original forward if it's
+    still queued.
+    """
+    target = route.target
+    full_text, format_kwargs = render_outgoing(prepared, route)
+
+    original = pending_forwards.get((source, copy_of, target))
+
+    async def wait_for_original():
+        try:
+            await asyncio.wait_for(original.wait(), REPLY_WAIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+
+    async def send_edit():
+        target_msg_id = await msg_id_map.get(source, copy_of, target)
+        if target_msg_id is None:
+            return None
+        try:
+            return await send_to_target(target, lambda account, peer: account.client.edit_message(
+                peer, target_msg_id, full_text, **format_kwargs
+            ))
+        except MessageNotModifiedError:
+            return None
+        except (MessageAuthorRequiredError, MessageIdInvalidError):
+            # Sent by another account before a failover, or deleted in the target
+            logger.warning(f"Cannot edit message {target_msg_id} in {target}")
+            DROPPED.inc("edit_refused")
+            return None
+
+    def record_edit(edited):
+        PROPAGATED.inc(target, "edit")
+        if should_log():
+            logger.info(f"✏️ Edited copy of message {message.id} from {source} in {target}")
+
+    dispatcher.submit(
         target,
-        full_text,
-        reply_to=reply_to_id,
-        parse_mode='md'
+        SendJob(
+            send_edit, record_edit, f"edit from {source}",
+            park=wait_for_original if original is not None else None
+        ),
+        lane="text"
     )
-    return sent_msg
 
-@client.on(events.NewMessage(chats=SOURCE_CHANNELS))
-async def handler(event):
+def is_new_edit(message, source):
+    """False for edit updates that didn't change the message (reactions, view counts)."""
+    key = (source, message.id)
+    if message.edit_date is None or _edit_dates.get(key) == message.edit_date:
+        return False
+    _edit_dates.pop(key, None)
+    _edit_dates[key] = message.edit_date
+    if len(_edit_dates) > _EDIT_DATES_MAX:
+        del _edit_dates[next(iter(_edit_dates))]
+    return True
+
+async def album_head(message, source):
+    """
+    ID of the first part of the album `message` belongs to. Albums are sent
+    in ID order with the caption on the first file, so that part's copy
+    carries the caption.
+    """
+    ids = list(range(max(1, message.id - MAX_ALBUM_PARTS + 1), message.id))
+    if not ids:
+        return message.id
+    try:
+        earlier = await client.get_messages(peer_cache.peer(source), ids=ids)
+    except Exception as e:
+        logger.warning(f"Could not look up the album of message {message.id} from {source}: {e}")
+        return message.id
+    return min([m.id for m in earlier if m is not None and m.grouped_id == message.grouped_id] + [message.id])
+
+def process_edit(message, source, copy_of=None):
+    """
+    Re-render an edited source message with each route's rules and suffix
+    and queue the edit for the targets it was forwarded to, applied to the
+    copy of `copy_of` (default: the message itself). Only text and captions
+    are propagated; replaced media is not, and neither are edits on
+    coalescing routes.
+    """
+    copy_of = copy_of or message.id
+    prepared_by_pipeline = {}
+    for route in routing_table.get(source):
+        pipeline = route.pipeline
+        # A merged copy holds other posts too; editing it would drop them
+        if route.coalesce or not pipeline.accepts(message.message):
+            continue
+        prepared = prepared_by_pipeline.get(id(pipeline))
+        if prepared is None:
+            prepared = prepared_by_pipeline[id(pipeline)] = prepare_text(message, pipeline)
+        submit_edit(message, source, route, prepared, copy_of)
+
+async def edit_handler(event):
     message = event.message
-    chat = await event.get_chat()
-    source = chat.username or str(chat.id)
+    source = await resolve_source(event)
+    await catch_up.done.wait()
+    if not is_new_edit(message, source):
+        return
+    copy_of = message.id
+    if message.grouped_id and ALBUM_WINDOW > 0 and media_key(message.media) is not None:
+        # Forwarded as one album: the caption lives on the copy of the first part
+        copy_of = await album_head(message, source)
+        if copy_of != message.id and not message.message:
+            return
+    process_edit(message, source, copy_of)
+
+def submit_deletes(target, items):
+    """Queue one delete_messages for the copies of `items` ((source, msg_id) pairs) in `target`."""
+    originals = {pending_forwards.get((source, msg_id, target)) for source, msg_id in items} - {None}
+
+    async def wait_for_originals():
+        try:
+            await asyncio.wait_for(asyncio.gather(*(o.wait() for o in originals)), REPLY_WAIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+
+    async def send_deletes():
+        target_msg_ids = [await msg_id_map.get(source, msg_id, target) for source, msg_id in items]
+        target_msg_ids = sorted({msg_id for msg_id in target_msg_ids if msg_id is not None})
+        if not target_msg_ids:
+            return None
+        await send_to_target(target, lambda account, peer: account.client.delete_messages(peer, target_msg_ids))
+        return target_msg_ids
+
+    def record_deletes(deleted):
+        PROPAGATED.inc(target, "delete", amount=len(deleted))
+        logger.info(f"🗑️ Deleted {len(deleted)} forwarded message(s) in {target}")
+
+    dispatcher.submit(
+        target,
+        SendJob(
+            send_deletes, record_deletes, f"{len(items)} deletes",
+            park=wait_for_originals if originals else None
+        ),
+        lane="text"
+    )
 
-    preview_text = (message.text or "")[:30]
-    logger.info(f"Message received from {source}: {preview_text}{'...' if len(message.text or '') > 30 else ''}")
+deletes = DeleteBatcher(DELETE_BATCH_WINDOW, submit_deletes)
 
-    target, referral = channel_map.get(source, (None, None))
-    if not target:
-        logger.warning(f"No target mapping found for source {source}")
+async def delete_handler(event):
+    # Only channels say where messages were deleted; the chat filter drops the rest
+    source = peer_cache.source_for_chat(event.chat_id)
+    if source is None:
         return
+    await catch_up.done.wait()
+    for route in routing_table.get(source):
+        if not route.coalesce:
+            deletes.add(route.target, source, event.deleted_ids)
 
-    try:
-        reply_to_id = None
-        if message.reply_to_msg_id:
-            reply_to_id = msg_id_map.get(message.reply_to_msg_id)
-
-        if message.media:          
-            if message.file and message.file.size > 5 * 1024 * 1024:
-                logger.info(f"⏩ Skipped media > 5MB from {source} to ensure real-time performance.")
-                return
-            caption = message.text or message.message or ""
-            caption_entities = message.entities
-            cleaned_caption, adjusted_caption_entities = remove_urls_and_adjust_entities(caption, caption_entities)
-
-            if cleaned_caption:
-                md_caption = entities_to_markdown(cleaned_caption.rstrip(), adjusted_caption_entities)
-                caption_full = f"{md_caption}\n\nRegister: {referral}"
-            else:
-                caption_full = f"Register: {referral}"
+async def replay_outbox():
+    """
+    Re-queue the forwards journaled by a previous run that were never
+    acknowledged. The messages are fetched again (media references expire),
+    up to 100 per request.
+    """
+    entries = await msg_id_map.unacked()
+    pending = {}
+    for source, msg_id, target in entries:
+        # Other shards' entries live in the same file
+        if source in routing_table.other_sources:
+            continue
+        if not routing_table.get(source):
+            msg_id_map.ack(source, msg_id, target)
+            continue
+        pending.setdefault(source, {}).setdefault(msg_id, set()).add(target)
+    if not pending:
+        return
+
+    replayed = 0
+    for source, targets_by_id in pending.items():
+        ids = sorted(targets_by_id)
+        for i in range(0, len(ids), 100):
+            chunk = ids[i:i + 100]
             try:
-                sent_msg = await asyncio.wait_for(
-                    client.send_file(
-                        target,
-                        file=message.media,
-                        caption=caption_full,
-                        reply_to=reply_to_id,
-                        parse_mode='md'
-                    ),
-                    timeout=5  # seconds
-                )
-                logger.info(f"✅ Forwarded media from {source} to {target}")
-            except asyncio.TimeoutError:
-                logger.warning(f"⚠️ Skipped delayed media message from {source} (took >5s to upload)")
-                return
-
-        else:
-            sent_msg = await send_preserving_entities(client, target, message, referral, reply_to_id)
-            logger.info(f"Forwarded text message from {source} to {target} preserving formatting")
-
-        if sent_msg:
-            msg_id_map[message.id] = sent_msg.id
-
-    except ChannelPrivateError:
-        logger.error(f"Cannot access target channel {target}. Check membership and permissions.")
-    except ChatAdminRequiredError:
-        logger.error(f"User needs admin rights in the target channel {target}.")
-    except FloodWaitError as e:
-        logger.warning(f"Flood wait for {e.seconds} seconds.")
-        await asyncio.sleep(e.seconds)
-    except Exception as e:
-        logger.error(f"Error while forwarding message from {source}: {e}", exc_info=True)
+                messages = await client.get_messages(peer_cache.peer(source), ids=chunk)
+            except Exception as e:
+                logger.error(f"Could not fetch outbox messages from {source}: {e}")
+                continue
+            for msg_id, message in zip(chunk, messages):
+                if message is None:
+                    # Deleted at the source meanwhile
+                    for target in targets_by_id[msg_id]:
+                        msg_id_map.ack(source, msg_id, target)
+                    continue
+                process_message(message, source, replay=True, targets=targets_by_id[msg_id])
+                replayed += 1
+    logger.info(f"📮 Replayed {replayed} unacknowledged messages from the outbox")
+
+def register_handler():
+    """
+    (Re-)register the handlers for the current sources. With RAW_UPDATES,
+    channel sources resolved so far go to raw_handler and only the rest to
+    the NewMessage handler. Edits and deletes always use Telethon's events.
+    """
+    global channel_sources
+    client.remove_event_handler(handler)
+    client.remove_event_handler(raw_handler)
+    client.remove_event_handler(edit_handler)
+    client.remove_event_handler(delete_handler)
+    sources = routing_table.sources
+    if not sources:
+        channel_sources = {}
+        return
+    chats = [lookup_key(s) for s in sources]
+    if PROPAGATE_EDITS:
+        client.add_event_handler(edit_handler, events.MessageEdited(chats=chats))
+    if PROPAGATE_DELETES:
+        client.add_event_handler(delete_handler, events.MessageDeleted(chats=chats))
+    if RAW_UPDATES:
+        channel_sources = {
+            -chat_id - 1000000000000: name
+            for chat_id, name in peer_cache.source_by_chat_id.items()
+            if chat_id < -1000000000000 and routing_table.get(name)
+        }
+        client.add_event_handler(raw_handler, events.Raw(UpdateNewChannelMessage))
+        raw_sources = set(channel_sources.values())
+        sources = [source for source in sources if source not in raw_sources]
+    if sources:
+        client.add_event_handler(handler, events.NewMessage(chats=[lookup_key(s) for s in sources]))
+
+register_handler()
+
+async def apply_routes(new_table):
+    """
+    Swap in a reloaded routing table. Peers that are new are resolved first,
+    so the swap itself is a single assignment plus re-registering the chat
+    filter, with no await in between. Jobs already queued keep the Route they
+    were created with and finish normally.
+    """
+    global routing_table
+    if not len(new_table):
+        logger.error("❌ Reloaded config has no routes, keeping the current routes")
+        return
+    warn_unowned(new_table)
+    # An empty share is applied too: this shard then stops forwarding and idles
+    new_table = new_table.shard(SHARD_INDEX, SHARD_COUNT)
+
+    old_routes = {(r.source, r.target) for r in routing_table.routes}
+    new_routes = {(r.source, r.target) for r in new_table.routes}
+    new_sources = [s for s in new_table.sources if s not in routing_table.by_source]
+    new_targets = [t for t in new_table.targets if t not in set(routing_table.targets)]
+
+    if new_sources or new_targets:
+        await peer_cache.warm_up(new_sources, new_targets)
+        for account in session_pool.accounts[1:]:
+            await account.peers.warm_up([], new_targets)
+
+    routing_table = new_table
+    register_handler()
+
+    for source, target in sorted(new_routes - old_routes):
+        logger.info(f"➕ Route {source} -> {target}")
+    for source, target in sorted(old_routes - new_routes):
+        logger.info(f"➖ Route {source} -> {target}")
+    logger.info(f"Routes reloaded: {len(new_table)} routes from {len(new_table.sources)} sources")
+
+def warn_unowned(table):
+    """
+    Log the routes of `table` that fall into a shard runner.py didn't start
+    (it only starts shards that had routes); they need a restart of runner.py.
+    Only the first running shard logs, so each route is reported once.
+    """
+    if SHARD_COUNT <= 1 or SHARD_INDEX != min(RUNNING_SHARDS):
+        return
+    shard_by_source = table.shard_by_source(SHARD_COUNT)
+    for route in table.routes:
+        shard = shard_by_source[route.source]
+        if shard not in RUNNING_SHARDS:
+            logger.warning(f"⚠️ Route {route.source} -> {route.target} belongs to shard {shard + 1}/{SHARD_COUNT}, which isn't "
+                           f"running; it is not forwarded until runner.py is restarted")
+
+STARTED_AT = time.time()
+
+def is_healthy():
+    """Connected and, if the watchdog runs, not stalled or reconnecting."""
+    if watchdog is not None:
+        return watchdog.healthy()
+    return all(account.client.is_connected() for account in session_pool.accounts)
+
+def health_route():
+    if is_healthy():
+        return 200, "text/plain", "I'm alive"
+    return 503, "text/plain", "connection stalled or reconnecting"
+
+def is_ready():
+    return catch_up is not None and catch_up.done.is_set() and is_healthy()
+
+def ready_route():
+    if is_ready():
+        return 200, "text/plain", "ready"
+    return 503, "text/plain", "not ready"
+
+def stats_route():
+    import json
+
+    stats = {
+        "shard": f"{SHARD_INDEX + 1}/{SHARD_COUNT}",
+        "uptime_seconds": round(time.time() - STARTED_AT),
+        "ready": is_ready(),
+        "routes": len(routing_table),
+        "routes_reloads": config_watcher.reloads if config_watcher else 0,
+        "sources": routing_table.sources,
+        "queue_depths": dispatcher.depths() if dispatcher else {},
+        "accounts": [
+            {
+                "name": account.name,
+                "connected": account.client.is_connected(),
+                "flooded_for": max(0, round(account.flooded_until - time.monotonic())),
+                "media_cache": len(account.media.cache.entries),
+                "media_uploads": account.media.uploads,
+            }
+            for account in session_pool.accounts
+        ],
+        "message_map_cached": len(msg_id_map.cache),
+        "connections": watchdog.status() if watchdog else {},
+    }
+    return 200, "application/json", json.dumps(stats)
+
+def metrics_route():
+    return 200, "text/plain; version=0.0.4; charset=utf-8", REGISTRY.render()
+
+HTTP_ROUTES = {
+    "/": health_route,
+    "/health": health_route,
+    "/ready": ready_route,
+    "/stats": stats_route,
+    "/metrics": metrics_route,
+}
+
+def collect_queue_depths():
+    if dispatcher is None:
+        return ()
+    return [((target,), depth) for target, depth in dispatcher.depths().items()]
+
+QUEUE_DEPTH.collect = collect_queue_depths
+
+def collect_ping_rtt():
+    if watchdog is None:
+        return ()
+    return [((name,), health.rtt) for name, health in watchdog.health.items() if health.rtt is not None]
+
+PING_RTT.collect = collect_ping_rtt
+
+startup.mark("imports")
 
 # Uncomment the following handler to print chat info to get channel IDs (run once)
 # @client.on(events.NewMessage())
@@ -254,16 +918,91 @@ async def handler(event):
 #     logger.info(f"Chat: {chat.title} ID: {chat.id} Username: {chat.username}")
 
 async def main():
-    logger.info("Starting Telegram userbot...")
-    logger.info(f"Monitoring source channels: {SOURCE_CHANNELS}")
-    logger.info(f"Forwarding to target channels: {TARGET_CHANNELS}")
-    logger.info(f"Using referral links: {REFERRAL_LINKS}")
-
-    keep_alive()
-
-    await client.start()
-    logger.info("Userbot connected to Telegram!")
-    await client.run_until_disconnected()
+    global dispatcher, catch_up, config_watcher, watchdog
+    logger.info(f"Starting Telegram userbot (shard {SHARD_INDEX + 1}/{SHARD_COUNT})...")
+    logger.info(f"Monitoring source channels: {routing_table.sources}")
+    logger.info(f"Forwarding to target channels: {routing_table.targets}")
+    for route in routing_table.routes:
+        logger.info(f"Route {route.source} -> {route.target} with suffix: {route.suffix}")
+    if not len(routing_table):
+        logger.warning("No routes for this shard, idling until a reload gives it some")
+    warn_unowned(all_routes)
+
+    web_server = HttpServer("0.0.0.0", PORT, HTTP_ROUTES)
+    await web_server.start()
+
+    await msg_id_map.open()
+    startup.mark("store")
+    # Every account gets its own bucket; all running shards log in with the
+    # same accounts, so each gets an equal share of it
+    n_accounts = len(session_pool.accounts)
+    global_rate = GLOBAL_RATE / len(RUNNING_SHARDS)
+    global_burst = max(1, GLOBAL_BURST // len(RUNNING_SHARDS))
+    dispatcher = SendDispatcher(
+        TARGET_RATE, TARGET_BURST, global_rate, global_burst, FLOOD_MAX_RETRIES,
+        lane_limits=LANE_LIMITS, account_for=session_pool.account_for
+    )
+    catch_up = CatchUp(client, msg_id_map, peer_cache, CATCHUP_MAX_AGE, CATCHUP_RATE, CATCHUP_LIMIT)
+
+    for account in session_pool.accounts:
+        await account.client.start()
+    logger.info(f"Userbot connected to Telegram with {n_accounts} account(s)!")
+    startup.mark("connect")
+    await peer_cache.warm_up(routing_table.sources, routing_table.targets)
+    for account in session_pool.accounts[1:]:
+        await account.peers.warm_up([], routing_table.targets)
+    startup.mark("peers")
+    for target in routing_table.targets:
+        logger.info(f"Target {target} is sent from {session_pool.owner(target)}")
+    if RAW_UPDATES:
+        # Channel IDs are known now
+        register_handler()
+        logger.info(f"Raw update fast path for {len(channel_sources)} channel source(s)")
+    if OUTBOX_ENABLED:
+        await replay_outbox()
+        startup.mark("outbox")
+    if CATCHUP_ENABLED:
+        await catch_up.run(routing_table.sources, lambda message, source: process_message(message, source, replay=True))
+        startup.mark("catch-up")
+    else:
+        catch_up.done.set()
+    logger.info(f"⏱️ Startup: {startup.summary()}")
+    if FAST_RUNTIME:
+        # Startup objects live forever; keep the collector from rescanning them
+        gc.freeze()
+    if ROUTES_FILE and ROUTES_RELOAD_INTERVAL > 0:
+        from config_watcher import ConfigWatcher
+
+        config_watcher = ConfigWatcher(ROUTES_FILE, load_routes_from_file, apply_routes, ROUTES_RELOAD_INTERVAL)
+        config_watcher.start()
+    if WATCHDOG_INTERVAL > 0:
+        watchdog = Watchdog(
+            session_pool.accounts, WATCHDOG_INTERVAL, WATCHDOG_PING_TIMEOUT,
+            WATCHDOG_MAX_FAILURES, WATCHDOG_UPDATE_SILENCE
+        )
+        watchdog.start()
+    try:
+        while True:
+            await client.run_until_disconnected()
+            # A watchdog reconnect also ends run_until_disconnected(); keep going
+            if watchdog is None or not watchdog.reconnecting(session_pool.listener):
+                break
+            await watchdog.wait_reconnected(session_pool.listener)
+    finally:
+        if watchdog is not None:
+            await watchdog.close()
+        if config_watcher is not None:
+            await config_watcher.close()
+        await web_server.close()
+        albums.flush_all()
+        bursts.flush_all()
+        deletes.flush_all()
+        if not await dispatcher.drain(SHUTDOWN_GRACE):
+            logger.warning(f"Send queues not empty after {SHUTDOWN_GRACE:.0f}s, leaving the rest to the outbox")
+        await dispatcher.close()
+        await msg_id_map.close()
+        for account in session_pool.accounts[1:]:
+            await account.client.disconnect()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run_forwarder(main, fast=FAST_RUNTIME)
@@ -0,0 +1,51 @@
+import asyncio
+from types import SimpleNamespace
+
+from telethon.errors import FileReferenceExpiredError
+from telethon.tl.types import (
+    DocumentAttributeVideo, InputFile, InputMediaUploadedDocument,
+    MessageMediaDocument
+)
+
+from media_cache import MediaCache, MediaSender
+
+
+class FakeClient:
+    def __init__(self):
+        self.sent = []
+        self.uploads = 0
+
+    async def send_file(self, target, file, **kwargs):
+        self.sent.append(file)
+        if len(self.sent) == 1:
+            raise FileReferenceExpiredError(None)
+        return [SimpleNamespace(media=None) for _ in file]
+
+    async def download_media(self, message, file=None):
+        return b"data"
+
+    async def upload_file(self, data, file_name=None):
+        self.uploads += 1
+        return InputFile(id=self.uploads, parts=1, name=file_name, md5_checksum="")
+
+
+def video_message(doc_id):
+    attributes = [DocumentAttributeVideo(duration=12, w=640, h=360)]
+    document = SimpleNamespace(id=doc_id, attributes=attributes, mime_type="video/mp4")
+    media = MessageMediaDocument(document=document)
+    return SimpleNamespace(media=media, document=document, file=SimpleNamespace(name="clip.mp4", ext=".mp4"))
+
+
+def test_album_reupload_keeps_attributes_and_caches_no_upload():
+    client = FakeClient()
+    sender = MediaSender(MediaCache())
+    messages = [video_message(1), video_message(2)]
+
+    asyncio.run(sender.send_album(client, "x", messages))
+
+    reuploaded = client.sent[1]
+    assert all(isinstance(media, InputMediaUploadedDocument) for media in reuploaded)
+    assert [media.attributes[0].duration for media in reuploaded] == [12, 12]
+    assert {media.mime_type for media in reuploaded} == {"video/mp4"}
+    assert not sender.cache.entries
+
@@ -0,0 +1,42 @@
+import pytest
+
+from routing import Route, RoutingTable, load_routes_from_file
+
+
+def test_suffix_renders_referral():
+    route = Route("a", "x", "https://r.example", "Join {{here}}: {referral}")
+    assert route.suffix == "Join {here}: https://r.example"
+
+
+@pytest.mark.parametrize("template", ["Join {here}: {referral}", "Join {0}", "Join {referral"])
+def test_bad_suffix_template_is_a_value_error(template):
+    with pytest.raises(ValueError, match="a -> x"):
+        Route("a", "x", "https://r.example", template)
+
+
+def test_shards_split_the_table_by_connected_routes():
+    table = RoutingTable([Route("a", "x", "r"), Route("b", "x", "r"), Route("c", "z", "r")])
+    shard_by_source = table.shard_by_source(4)
+    assert shard_by_source["a"] == shard_by_source["b"]
+    shares = [table.shard(i, 4) for i in range(4)]
+    assert sum(len(share) for share in shares) == len(table)
+    for i, share in enumerate(shares):
+        assert all(shard_by_source[route.source] == i for route in share.routes)
+        assert share.other_sources == {s for s, shard in shard_by_source.items() if shard != i}
+
+
+def write_routes(tmp_path, route):
+    path = tmp_path / "routes.yaml"
+    path.write_text("routes:\n  - {source: a, target: x, referral: r%s}\n" % route)
+    return str(path)
+
+
+def test_bad_route_max_age_names_the_route(tmp_path):
+    with pytest.raises(ValueError, match="Route #1 .* invalid max_age: 'soon'"):
+        load_routes_from_file(write_routes(tmp_path, ", max_age: soon"))
+
+
+def test_bad_route_max_age_default_names_the_variable(tmp_path, monkeypatch):
+    monkeypatch.setenv("ROUTE_MAX_AGE", "abc")
+    with pytest.raises(ValueError, match="ROUTE_MAX_AGE"):
+        load_routes_from_file(write_routes(tmp_path, ""))
@@ -0,0 +1,33 @@
+import asyncio
+
+from send_queue import SendDispatcher
+
+
+def test_targets_share_the_bucket_of_their_account():
+    accounts = {"x": "account0", "y": "account0", "z": "account1"}
+
+    async def run():
+        dispatcher = SendDispatcher(1, 1, 25, 30, account_for=accounts.get)
+        buckets = [dispatcher.account_bucket(target) for target in ("x", "y", "z")]
+        await dispatcher.close()
+        return buckets
+
+    x, y, z = asyncio.run(run())
+    assert x is y
+    assert x is not z
+    assert (z.rate, z.capacity) == (25, 30)
+
+
+def test_bucket_follows_failover():
+    owner = {"x": "account0"}
+
+    async def run():
+        dispatcher = SendDispatcher(1, 1, 25, 30, account_for=owner.get)
+        before = dispatcher.account_bucket("x")
+        owner["x"] = "account1"
+        after = dispatcher.account_bucket("x")
+        await dispatcher.close()
+        return before, after
+
+    before, after = asyncio.run(run())
+    assert before is not after
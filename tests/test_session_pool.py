@@ -0,0 +1,20 @@
+import asyncio
+
+from telethon.errors import FloodWaitError
+
+from metrics import FLOOD_WAIT_SECONDS
+from session_pool import Account, SessionPool
+
+
+def test_failover_counts_the_flood_wait():
+    pool = SessionPool([Account(i, None, None, None) for i in range(2)], failover_after=30)
+    first = pool.owner("x")
+    before = FLOOD_WAIT_SECONDS.values.get(("x",), 0)
+
+    async def send(account):
+        if account is first:
+            raise FloodWaitError(None, capture=120)
+        return account
+
+    assert asyncio.run(pool.call("x", send)) is not first
+    assert FLOOD_WAIT_SECONDS.values.get(("x",), 0) - before == 120
@@ -0,0 +1,77 @@
+import pytest
+from telethon.tl.types import MessageEntityBold, MessageEntityItalic, MessageEntityTextUrl
+
+from text_transform import (
+    RulePipeline, join_texts, remove_urls_and_adjust_entities, utf16_len
+)
+
+
+def spans(entities):
+    return [(type(ent).__name__, ent.offset, ent.length) for ent in entities or ()]
+
+
+def test_url_removal_shifts_following_entities():
+    text = "Go https://a.com/x now BUY"
+    bold = MessageEntityBold(offset=text.index("BUY"), length=3)
+    cleaned, entities = remove_urls_and_adjust_entities(text, [bold])
+    assert cleaned == "Go  now BUY"
+    assert cleaned[entities[0].offset:entities[0].offset + entities[0].length] == "BUY"
+
+
+def test_offsets_count_emoji_as_two_units():
+    text = "🚀 https://a.com BUY"
+    # "🚀" is two UTF-16 units, so "BUY" starts at 2 + 1 + 13 + 1
+    bold = MessageEntityBold(offset=17, length=3)
+    cleaned, entities = remove_urls_and_adjust_entities(text, [bold])
+    assert cleaned == "🚀  BUY"
+    assert spans(entities) == [("MessageEntityBold", 4, 3)]
+
+
+def test_text_links_are_removed_whole():
+    text = "Join here today"
+    link = MessageEntityTextUrl(offset=5, length=4, url="https://a.com")
+    italic = MessageEntityItalic(offset=10, length=5)
+    cleaned, entities = remove_urls_and_adjust_entities(text, [link, italic])
+    assert cleaned == "Join  today"
+    assert spans(entities) == [("MessageEntityItalic", 6, 5)]
+
+
+def test_empty_result_is_none():
+    assert remove_urls_and_adjust_entities("https://a.com", None) == (None, None)
+
+
+def test_literal_and_regex_rules_agree():
+    text = "VIP signal, vip entry"
+    literal = RulePipeline(replacements=[("vip", "premium")])
+    regex = RulePipeline(replacements=[(r"v[i]p", "premium")])
+    assert literal.apply(text, None) == regex.apply(text, None) == ("premium signal, premium entry", None)
+
+
+def test_url_stripping_wins_over_literal_rules():
+    text = "see https://a.com/x now"
+    literal = RulePipeline(replacements=[("https", "H")])
+    regex = RulePipeline(replacements=[(r"https", "H")])
+    assert literal.apply(text, None) == regex.apply(text, None) == ("see  now", None)
+
+
+def test_capturing_groups_are_rejected():
+    with pytest.raises(ValueError, match="capturing groups"):
+        RulePipeline(replacements=[(r"(\d)\1", "x")])
+    assert RulePipeline(replacements=[(r"(?:\d)+", "N")]).apply("price 11", None) == ("price N", None)
+
+
+def test_mentions_and_keyword_filters():
+    pipeline = RulePipeline(strip_mentions=True, include=["buy"], exclude=["loss"])
+    assert pipeline.apply("BUY now @someone", None) == ("BUY now", None)
+    assert pipeline.accepts("Buy BTC")
+    assert not pipeline.accepts("buy, stop loss hit")
+    assert not pipeline.accepts("sell")
+
+
+def test_join_texts_shifts_entities_in_utf16_units():
+    first = ("🚀 up", [MessageEntityBold(offset=3, length=2)])
+    second = ("go now", [MessageEntityItalic(offset=3, length=3)])
+    text, entities = join_texts([first, (None, None), second])
+    assert text == "🚀 up\n\ngo now"
+    offset = utf16_len("🚀 up\n\n")
+    assert spans(entities) == [("MessageEntityBold", 3, 2), ("MessageEntityItalic", offset + 3, 3)]
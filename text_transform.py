@@ -0,0 +1,369 @@
+"""
+Text transforms applied to every forwarded message: the compiled rule
+pipeline (URL and @mention stripping, regex replacements, keyword filters)
+with entity remapping, and the Telegram entities -> Markdown converter.
+
+Telegram measures entity offsets in UTF-16 code units while Python indexes
+strings by code point, so anything outside the BMP (most emojis) counts as two
+units on the Telegram side. Texts containing such characters are temporarily
+expanded into surrogate pairs so both sides agree on offsets.
+"""
+
+import re
+from bisect import bisect_right
+
+from telethon.tl.types import (
+    MessageEntityTextUrl, MessageEntityUrl,
+    MessageEntityBold, MessageEntityItalic,
+    MessageEntityCode, MessageEntityPre
+)
+
+URL_PATTERN = re.compile(r'https?://\S+')
+
+URL_ENTITY_TYPES = (MessageEntityTextUrl, MessageEntityUrl)
+
+_ASTRAL = re.compile('[\U00010000-\U0010FFFF]')
+
+
+def _to_surrogate_pair(match):
+    code = ord(match.group()) - 0x10000
+    return chr(0xD800 + (code >> 10)) + chr(0xDC00 + (code & 0x3FF))
+
+
+def add_surrogate(text):
+    """Expand astral characters into surrogate pairs (UTF-16 indexing)."""
+    if _ASTRAL.search(text) is None:
+        return text
+    return _ASTRAL.sub(_to_surrogate_pair, text)
+
+
+def del_surrogate(text):
+    """Inverse of add_surrogate."""
+    return text.encode('utf-16', 'surrogatepass').decode('utf-16')
+
+
+def merge_spans(spans):
+    """Merge sorted (start, end) spans that overlap or touch."""
+    merged = []
+    for start, end in spans:
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class RulePipeline:
+    """
+    The per-route text rules, compiled once into a single matcher.
+
+    URL stripping, @mention stripping and literal regex replacements are
+    joined into one alternation with a named group per rule, so a message is
+    scanned once no matter how many rules there are; `match.lastgroup` tells
+    which rule matched. URL entities (text links) are always removed whole
+    when URLs are stripped, and matches overlapping them are ignored.
+
+    Keyword filters decide whether the route gets the message at all:
+    `include` requires at least one keyword, `exclude` rejects on any.
+    Replacement patterns are used as-is and must not contain capturing groups
+    (the combined pattern renumbers them, so backreferences would point at the
+    wrong group; use `(?:...)`) or global inline flags; set `ignore_case`
+    instead. URL and @mention stripping take precedence over every rule.
+    """
+
+    def __init__(self, strip_urls=True, strip_mentions=False, replacements=(),
+                 include=(), exclude=(), ignore_case=True):
+        self.strip_urls = strip_urls
+        self.ignore_case = ignore_case
+        flags = "i" if ignore_case else ""
+        parts = []
+        self.replacement_for = {}
+        if strip_urls:
+            parts.append(f"(?P<url>{URL_PATTERN.pattern})")
+            self.replacement_for["url"] = ""
+        if strip_mentions:
+            parts.append(r"(?P<mention>(?<![\w@])@[A-Za-z]\w{3,31}\b)")
+            self.replacement_for["mention"] = ""
+        builtin = len(parts)
+
+        # Plain-text rules share one trie-shaped group, so matching cost
+        # doesn't grow with their number; the matched text picks the replacement
+        self.literal_replacements = {}
+        for i, (pattern, replacement) in enumerate(replacements):
+            if _is_literal(pattern):
+                key = pattern.lower() if ignore_case else pattern
+                self.literal_replacements.setdefault(key, add_surrogate(replacement))
+                continue
+            # Report a bad rule on its own, not inside the combined pattern
+            if re.compile(pattern).groups:
+                raise ValueError(f"Replacement pattern {pattern!r} has capturing groups; use (?:...) instead")
+            name = f"r{i}"
+            parts.append(f"(?P<{name}>(?{flags}:{pattern}))" if flags else f"(?P<{name}>{pattern})")
+            self.replacement_for[name] = add_surrogate(replacement)
+        if self.literal_replacements:
+            trie = _trie_pattern(self.literal_replacements)
+            parts.insert(builtin, f"(?P<literal>(?{flags}:{trie}))" if flags else f"(?P<literal>{trie})")
+
+        self.matcher = re.compile("|".join(parts)) if parts else None
+        self.include = _keyword_matcher(include, ignore_case)
+        self.exclude = _keyword_matcher(exclude, ignore_case)
+        self.rule_count = len(parts) + len(include) + len(exclude)
+
+    def _replacement(self, match):
+        name = match.lastgroup
+        if name == "literal":
+            text = match.group()
+            return self.literal_replacements[text.lower() if self.ignore_case else text]
+        return self.replacement_for[name]
+
+    def accepts(self, text):
+        text = text or ""
+        if self.include is not None and self.include.search(text) is None:
+            return False
+        if self.exclude is not None and self.exclude.search(text) is not None:
+            return False
+        return True
+
+    def find_edits(self, text, entities):
+        """
+        Sorted, non-overlapping (start, end, replacement) edits for `text`
+        (UTF-16 indexed).
+        """
+        entity_spans = []
+        if self.strip_urls:
+            entity_spans = merge_spans(sorted(
+                (ent.offset, ent.offset + ent.length)
+                for ent in entities or ()
+                if isinstance(ent, URL_ENTITY_TYPES)
+            ))
+
+        edits = [(start, end, "") for start, end in entity_spans]
+        if self.matcher is not None:
+            i = 0
+            for match in self.matcher.finditer(text):
+                start, end = match.span()
+                if start == end:
+                    continue
+                # Both sequences are sorted, so a single forward pointer is enough
+                while i < len(entity_spans) and entity_spans[i][1] <= start:
+                    i += 1
+                if i < len(entity_spans) and entity_spans[i][0] < end:
+                    continue
+                edits.append((start, end, self._replacement(match)))
+
+        edits.sort()
+        return _merge_removals(edits)
+
+    def apply(self, text, entities):
+        """
+        Rewrite `text` and remap `entities`. Returns (text, entities) with
+        None for empty results, like remove_urls_and_adjust_entities().
+        """
+        if not text:
+            return None, None
+
+        utf16_text = add_surrogate(text)
+        edits = self.find_edits(utf16_text, entities)
+
+        if edits:
+            pieces = []
+            pos = 0
+            for start, end, replacement in edits:
+                pieces.append(utf16_text[pos:start])
+                pieces.append(replacement)
+                pos = end
+            pieces.append(utf16_text[pos:])
+            cleaned = ''.join(pieces)
+        else:
+            cleaned = utf16_text
+
+        stripped = cleaned.strip()
+        lead = len(cleaned) - len(cleaned.lstrip())
+        remap = OffsetMap(edits)
+
+        adjusted_entities = []
+        for ent in entities or ():
+            if self.strip_urls and isinstance(ent, URL_ENTITY_TYPES):
+                continue
+            start = max(remap(ent.offset) - lead, 0)
+            end = min(remap(ent.offset + ent.length, end=True) - lead, len(stripped))
+            if end <= start:
+                continue
+            adjusted_entities.append(copy_entity(ent, start, end - start))
+
+        cleaned_text = del_surrogate(stripped) if utf16_text is not text else stripped
+        return cleaned_text if cleaned_text else None, adjusted_entities if adjusted_entities else None
+
+
+_REGEX_METACHARACTERS = set(".^$*+?{}[]\\|()")
+
+
+def _is_literal(pattern):
+    return bool(pattern) and not _REGEX_METACHARACTERS.intersection(pattern)
+
+
+def _trie_pattern(words):
+    """
+    A regex matching any of `words`, shaped as a trie so the engine follows
+    one branch per character instead of trying every word in turn. Longer
+    words win over their prefixes.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            return f"(?:{body})?"
+        return body
+
+    return build(trie)
+
+
+def _keyword_matcher(keywords, ignore_case):
+    if not keywords:
+        return None
+    words = [k.lower() for k in keywords] if ignore_case else list(keywords)
+    return re.compile(rf"(?<!\w){_trie_pattern(words)}(?!\w)", re.IGNORECASE if ignore_case else 0)
+
+
+def _merge_removals(edits):
+    """
+    Merge overlapping or touching pure removals (URL entities next to bare
+    URLs); edits with a replacement are never merged.
+    """
+    merged = []
+    for start, end, replacement in edits:
+        if merged and start <= merged[-1][1] and not replacement and not merged[-1][2]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end, "")
+        elif merged and start < merged[-1][1]:
+            continue
+        else:
+            merged.append((start, end, replacement))
+    return merged
+
+
+class OffsetMap:
+    """
+    Prefix-offset table mapping positions in the original text to positions
+    after the given (start, end, replacement) edits. A position inside an
+    edited span collapses onto the start of its replacement, or onto its end
+    when mapping the end of an entity that covers the whole span.
+    """
+
+    __slots__ = ("starts", "edits", "shift_before")
+
+    def __init__(self, edits):
+        self.edits = edits
+        self.starts = [start for start, _, _ in edits]
+        self.shift_before = []
+        shift = 0
+        for start, end, replacement in edits:
+            self.shift_before.append(shift)
+            shift += len(replacement) - (end - start)
+
+    def __call__(self, pos, end=False):
+        i = bisect_right(self.starts, pos) - 1
+        if end and i >= 0 and pos == self.starts[i]:
+            # An entity ending exactly where an edit starts doesn't include it
+            i -= 1
+        if i < 0:
+            return pos
+        start, stop, replacement = self.edits[i]
+        if pos < stop:
+            return start + self.shift_before[i]
+        return pos + self.shift_before[i] + len(replacement) - (stop - start)
+
+
+def copy_entity(ent, offset, length):
+    return type(ent)(
+        offset=offset,
+        length=length,
+        **{k: v for k, v in vars(ent).items() if k not in ('offset', 'length')}
+    )
+
+
+# Strips URLs only; the behaviour every route had before rules existed
+URL_ONLY = RulePipeline()
+
+
+def remove_urls_and_adjust_entities(text, entities):
+    return URL_ONLY.apply(text, entities)
+
+
+def append_suffix(text, entities, suffix):
+    """
+    Append a route's referral suffix to already-cleaned text. The suffix goes
+    after the text, so entity offsets stay valid and can be sent as-is through
+    `formatting_entities`.
+    """
+    if text:
+        return f"{text}\n\n{suffix}", list(entities or ())
+    return suffix, []
+
+
+def utf16_len(text):
+    """Length of `text` in UTF-16 code units, as Telegram counts it."""
+    return len(add_surrogate(text)) if text else 0
+
+
+def join_texts(parts, separator="\n\n"):
+    """
+    Join cleaned (text, entities) pairs into one message, shifting each
+    part's entity offsets past the text before it. Empty parts are skipped.
+    """
+    texts = []
+    entities = []
+    offset = 0
+    for text, part_entities in parts:
+        if not text:
+            continue
+        if texts:
+            offset += utf16_len(separator)
+        texts.append(text)
+        entities.extend(copy_entity(ent, ent.offset + offset, ent.length) for ent in part_entities or ())
+        offset += utf16_len(text)
+    return separator.join(texts) or None, entities or None
+
+
+def entities_to_markdown(text, entities):
+    """
+    Simple converter from Telegram entities to Markdown formatting.
+    """
+    if not entities:
+        return text
+
+    entities = sorted(entities, key=lambda e: e.offset, reverse=True)
+
+    for ent in entities:
+        start = ent.offset
+        end = start + ent.length
+        substring = text[start:end]
+
+        if isinstance(ent, MessageEntityBold):
+            md = f"**{substring}**"
+        elif isinstance(ent, MessageEntityItalic):
+            md = f"*{substring}*"
+        elif isinstance(ent, MessageEntityCode):
+            md = f"`{substring}`"
+        elif isinstance(ent, MessageEntityPre):
+            md = f"```\n{substring}\n```"
+        elif isinstance(ent, MessageEntityTextUrl):
+            md = f"[{substring}]({ent.url})"
+        elif isinstance(ent, MessageEntityUrl):
+            md = f"[{substring}]({substring})"
+        else:
+            md = substring
+
+        text = text[:start] + md + text[end:]
+
+    return text